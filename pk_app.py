@@ -2,9 +2,28 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import os
-import math
-import re
+import threading
+from collections import OrderedDict
+from collections import deque
+from functools import wraps
 import altair as alt
+import io
+import pk_calc
+import pk_dataset
+import pk_models
+import pk_nca
+import pk_profiling
+from pk_core import (DATA_FILE, batch_pk_parameters, build_catalog, exposure_metrics, find_column,
+                     list_workbooks, numeric_values, page_bounds, sort_ranks, source_signature)
+from pk_covariates import DEFAULT_COVARIATES, HEPATIC_CLASSES, SEXES, adjust_numeric_table, patient_crcl
+from pk_fit import FIT_MODELS, fit_sample_table, fitted_model_params, parse_sample_text
+from pk_models import (CHART_MAX_POINTS, DEFAULT_KA, PK_MODELS, SS_FRACTION, adaptive_time_points,
+                       curves_to_long, dosing_schedule, drug_model_params, lttb_indices,
+                       model_concentration, parse_dose_delays, parse_dose_numbers,
+                       regimen_concentrations, regimen_steady_state, regimen_time_grid,
+                       steady_state_metrics, superposition_profile, time_to_concentration)
+from pk_search import query_search_index
+from pk_units import convert
 
 # --- CONFIGURATION ---
 st.set_page_config(
@@ -12,6 +31,54 @@ st.set_page_config(
     layout="wide"
 )
 
+# --- PROFILING ---
+# Opt-in (PK_PROFILE=1 or ?profile=1): every rerun is timed stage by stage (see pk_profiling),
+# logged as one JSON line and shown in the developer panel in the sidebar. Cache calls / misses
+# are always counted.
+PROFILING = pk_profiling.enabled_by_env() or st.query_params.get("profile") == "1"
+if PROFILING:
+    profile_session = st.session_state.setdefault("profile_session", os.urandom(4).hex())
+    pk_profiling.begin_run("script", profile_session, st.session_state.pop("profile_capture", None))
+
+
+def counted_cache(cache, **options):
+    # st.cache_data / st.cache_resource that also feeds the profiling counters: every call is
+    # counted, and every run of the function body as a miss
+    def decorate(func):
+        name = func.__name__
+
+        @wraps(func)
+        def compute(*args, **kwargs):
+            pk_profiling.count(name, "misses")
+            return func(*args, **kwargs)
+
+        cached = cache(**options)(compute)
+
+        @wraps(func)
+        def call(*args, **kwargs):
+            pk_profiling.count(name, "calls")
+            with pk_profiling.span(f"cache:{name}"):
+                return cached(*args, **kwargs)
+
+        call.clear = cached.clear
+        return call
+    return decorate
+
+
+def profiled_fragment(func):
+    # Goes under @st.fragment: a rerun of just this fragment is timed as a run of its own
+    @wraps(func)
+    def run_fragment(*args, **kwargs):
+        if not PROFILING:
+            return func(*args, **kwargs)
+        with pk_profiling.profiled_run(f"fragment:{func.__name__}", profile_session) as run:
+            with pk_profiling.span(f"view:{func.__name__}"):
+                result = func(*args, **kwargs)
+        if run["record"] is not None:
+            st.session_state.setdefault("profile_runs", deque(maxlen=PROFILE_HISTORY)).append(run["record"])
+        return result
+    return run_fragment
+
 # --- CUSTOM CSS FOR HOSPITAL BLUE THEME (LARGE SIZE) ---
 st.markdown("""
 <style>
@@ -182,115 +249,208 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- DATA LOADING FUNCTION ---
+# Parsing, models, search and dataset reloads live in pk_core / pk_models / pk_search /
+# pk_dataset (no streamlit there); this file only adds caching, widgets and error messages on top.
+
+@counted_cache(st.cache_data)
+def dataset_catalog(workbook_signatures):
+    # Sources (workbook sheets + merged view) of the workbooks in DATA_DIR; listed again whenever
+    # a workbook is added, removed or saved
+    return build_catalog([signature[0] for signature in workbook_signatures])
+
+
+@counted_cache(st.cache_resource)
+def dataset_watcher(source):
+    # Started once per server process and source, the first time any session opens that source.
+    # A background thread reloads the source when its workbook changes, re-parsing only edited
+    # rows, and swaps in the new version; sessions never wait for a reload.
+    # Every version is shared read-only by all sessions (the drug table's columns are Arrow arrays
+    # over the memory-mapped columnar cache, shared by worker processes too): never modify in place.
+    return pk_dataset.start_watcher(source)
+
+
+catalog = dataset_catalog(tuple(source_signature(path)
+                          for path in list_workbooks()))
+if st.session_state.get("dataset_source") not in catalog:
+    st.session_state.dataset_source = DATA_FILE
+dataset_source = st.session_state.dataset_source
+
+# One complete dataset version per full run; fragments keep using it until the next full run
+dataset = dataset_watcher(catalog[dataset_source])["current"]
+if dataset["message"]:
+    level, text = dataset["message"]
+    getattr(st, level)(text)
+
+data_signature = dataset["signature"]
+df = dataset["data"]
+numeric_df = dataset["numeric"]
+drug_labels = dataset["labels"]
+
+
+@counted_cache(st.cache_data, max_entries=32)
+def patient_numeric_table(signature, source, covariates, _data, _numeric):
+    # Numeric table scaled for one patient, cached per dataset version and covariate set
+    return adjust_numeric_table(_data, _numeric, dict(covariates))
+
+
+# Patient covariates (entered in the header below) rescale Vd, CL and t½ of every drug at once;
+# numeric_signature identifies the numeric table in use for caches built from it
+patient = {name: st.session_state.get(f"patient_{name}", value)
+           for name, value in DEFAULT_COVARIATES.items()}
+patient_key = tuple(patient.items()) if st.session_state.get("patient_enabled") else None
+if patient_key and not df.empty:
+    numeric_df = patient_numeric_table(data_signature, dataset_source, patient_key, df, numeric_df)
+numeric_signature = (data_signature, patient_key)
+
+# Switching datasets is not an update; only a new version of the same source is announced
+previous_source, previous_signature = st.session_state.get(
+    "data_version", (dataset_source, data_signature))
+if previous_source == dataset_source and previous_signature != data_signature:
+    st.toast(
+        f"Drug data updated ({dataset['parsed_rows']} new or edited rows).")
+st.session_state.data_version = (dataset_source, data_signature)
+
+
+def lookup_numeric(idx, col, field="value"):
+    # Parsed number for a single cell, or None when missing/unparseable
+    if (col, field) not in numeric_df.columns:
+        return None
+    val = numeric_df.at[idx, (col, field)]
+    return None if pd.isna(val) else float(val)
+
+
+# --- PK MODELS ---
+
+# Population runs are cached per drug / settings (pk_models.simulate_population is uncached)
+simulate_population = counted_cache(st.cache_data, max_entries=32)(
+    pk_models.simulate_population)
+
+
+def model_option_inputs(model, key_prefix, default_ka=None):
+    # Extra inputs for the selected model (absorption / distribution); widget keys are prefixed per view
+    options = {"ka": None, "tlag": 0.0, "alpha_ratio": 10.0,
+               "frac_alpha": 0.5, "f": 1.0}
+    model_params = PK_MODELS[model]["params"]
+    if "ka" in model_params:
+        ka_label = "Absorption Rate (ka) [1/h]" if default_ka is None else \
+            "Absorption Rate (ka) [1/h] (0 = derive from Tmax)"
+        options["ka"] = st.number_input(ka_label, min_value=0.0, value=DEFAULT_KA if default_ka is None else default_ka,
+                                        step=0.1, format="%.3f", key=f"{key_prefix}_ka", persist_state="page")
+        options["tlag"] = st.number_input("Absorption Lag Time (tlag) [h]", min_value=0.0, value=0.0,
+                                          step=0.25, key=f"{key_prefix}_tlag", persist_state="page")
+    if "alpha" in model_params:
+        options["alpha_ratio"] = st.number_input("Distribution / Elimination Rate Ratio (α/k)", min_value=1.01,
+                                                 value=10.0, step=1.0, key=f"{key_prefix}_alpha_ratio", persist_state="page")
+        options["frac_alpha"] = st.number_input("Fraction of C0 in Distribution Phase", min_value=0.0, max_value=0.99,
+                                                value=0.5, step=0.05, key=f"{key_prefix}_frac_alpha", persist_state="page")
+    return options
+
+
+# --- CHART SPEC CACHE ---
+# Bounded LRU of finished Vega-Lite specs, shared by all sessions of this server process. A hit
+# skips both the curve computation and the Altair chart construction.
+
+CHART_CACHE_SIZE = 256
+
+
+@st.cache_resource
+def chart_spec_cache():
+    return {"specs": OrderedDict(), "hits": 0, "misses": 0, "lock": threading.Lock()}
+
 
+def cached_chart_spec(key, build_chart):
+    # Spec for key; build_chart() (returning an Altair chart) only runs on a miss
+    cache = chart_spec_cache()
+    pk_profiling.count("chart_spec", "calls")
+    with cache["lock"]:
+        spec = cache["specs"].get(key)
+        if spec is not None:
+            cache["specs"].move_to_end(key)
+            cache["hits"] += 1
+            return spec
+        cache["misses"] += 1
+
+    pk_profiling.count("chart_spec", "misses")
+    with pk_profiling.span(f"chart build:{key[0]}"):
+        spec = build_chart().to_dict()
+    with cache["lock"]:
+        cache["specs"][key] = spec
+        while len(cache["specs"]) > CHART_CACHE_SIZE:
+            cache["specs"].popitem(last=False)
+    return spec
 
-@st.cache_data
-def load_data():
-    # Helper function to clean and format headers scientifically
-    def clean_header(c):
-        original = c.strip()
 
-        # 1. Rename AUC explicitly - Case Insensitive Check
-        if original.lower() == "auc":
-            return "Area Under the Curve (AUC) [ng.hr/mL]"
+def chart_cache_stats():
+    cache = chart_spec_cache()
+    with cache["lock"]:
+        return {"hits": cache["hits"], "misses": cache["misses"], "entries": len(cache["specs"])}
 
-        # 2. Fix Scientific Units (Title casing destroys units like mL, pH, etc.)
-        c_title = original.title()
 
-        # Restore specific unit capitalization
-        c_title = c_title.replace("Ng/Ml", "ng/mL")
-        c_title = c_title.replace("Ug/Ml", "µg/mL")
-        c_title = c_title.replace("Mg/L", "mg/L")
-        c_title = c_title.replace("Ng.Hr/Ml", "ng.hr/mL")
-        c_title = c_title.replace("Ng*H/Ml", "ng.hr/mL")
-        c_title = c_title.replace("Ml/Min", "mL/min")
-        c_title = c_title.replace("L/Min", "L/min")
-        c_title = c_title.replace("Iv", "IV")
+def show_chart(spec):
+    # Streamlit moves the data out of the top level of the spec it is given, so pass a copy
+    with pk_profiling.span("chart send"):
+        st.vega_lite_chart(spec=dict(spec), use_container_width=True)
 
-        return c_title
 
-    # Check if the user's Excel file exists
-    if os.path.exists("drug_data.xlsx"):
-        try:
-            # Load the Excel file
-            df = pd.read_excel("drug_data.xlsx")
+# --- SEARCH ---
+
+@counted_cache(st.cache_data, max_entries=512)
+def search_rows(signature, query, _index):
+    # Cached per dataset version and query (the index itself is not hashed)
+    return query_search_index(_index, query)
 
-            # Apply the clean_header function to all columns
-            df.columns = [clean_header(c) for c in df.columns]
 
-            # Ensure critical columns exist. If not, try to guess or use defaults.
-            # We need 'Name' and 'Class' for the logic to work.
-            if 'Name' not in df.columns:
-                st.error(
-                    "Error: Your Excel file must have a column labeled 'Name'.")
-                return pd.DataFrame()  # Return empty on error
-            if 'Class' not in df.columns:
-                # If no class column, add a placeholder
-                df['Class'] = "Uncategorized"
+# --- BULK CALCULATOR MODE ---
+
+def read_uploaded_table(upload):
+    if upload.name.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(upload)
+    return pd.read_csv(upload)
+
 
-            return df
+def bulk_mode(name, key):
+    # Upload many cases at once, run the calculator formula over every row and download the result
+    with st.expander("Bulk Mode (CSV / Excel)", expanded=False):
+        inputs = pk_calc.BULK_CALCULATORS[name]["inputs"]
+        st.write(
+            f"Upload a file with one row per case and the columns: `{'`, `'.join(inputs)}`")
+        upload = st.file_uploader("Input file", type=[
+                                  "csv", "xlsx", "xls"], key=f"{key}_bulk_file")
+        if upload is None:
+            return
+
+        try:
+            table = read_uploaded_table(upload)
         except Exception as e:
-            st.error(f"Error reading Excel file: {e}")
-            return pd.DataFrame()
+            st.error(f"Error reading uploaded file: {e}")
+            return
+
+        missing = pk_calc.missing_bulk_columns(name, table)
+        if missing:
+            st.error(f"Missing columns: {', '.join(missing)}")
+            return
+
+        result = pk_calc.run_bulk(name, table)
+        st.write(f"Computed {len(result)} rows (first 100 shown)")
+        st.dataframe(result.head(100), hide_index=True,
+                     use_container_width=True)
+
+        download_results(result, os.path.splitext(upload.name)[0], key)
+
+
+def download_results(result, stem, key):
+    # CSV / Excel download of a bulk result table
+    out_format = st.radio("Download format", [
+                          "CSV", "Excel"], horizontal=True, key=f"{key}_bulk_format")
+    if out_format == "CSV":
+        st.download_button("Download Results", result.to_csv(index=False).encode("utf-8"),
+                           file_name=f"{stem}_results.csv", mime="text/csv", key=f"{key}_bulk_download")
     else:
-        # FALLBACK: Use Mock Data if file not found
-        st.warning("⚠️ 'drug_data.xlsx' not found. Displaying mock data.")
-        # Updated mock data to match the new naming conventions
-        INITIAL_DATA = [
-            {
-                "Name": "Lisinopril",
-                "Class": "ACE Inhibitor",
-                "Half-Life": "12h",
-                "Cmax": "40 ng/mL",
-                "Area Under the Curve (AUC) [ng.hr/mL]": "500 ng·h/mL",
-                "Bioavailability": "25%",
-                "Clearance": "50 mL/min"
-            },
-            {
-                "Name": "Atorvastatin",
-                "Class": "Statin",
-                "Half-Life": "14h",
-                "Cmax": "20 ng/mL",
-                "Area Under the Curve (AUC) [ng.hr/mL]": "200 ng·h/mL",
-                "Bioavailability": "14%",
-                "Clearance": "N/A"
-            },
-            {
-                "Name": "Metoprolol",
-                "Class": "Beta Blocker",
-                "Half-Life": "3-7h",
-                "Cmax": "100 ng/mL",
-                "Area Under the Curve (AUC) [ng.hr/mL]": "1200 ng·h/mL",
-                "Bioavailability": "50%",
-                "Clearance": "1 L/min"
-            },
-        ]
-        return pd.DataFrame(INITIAL_DATA)
-
-
-# Load the data
-df = load_data()
-
-# Helper function to extract numeric values from strings (e.g., "12h" -> 12.0, "61 ± 13.42" -> 61.0)
-
-
-def extract_numeric(val_str):
-    if isinstance(val_str, (int, float)):
-        return float(val_str)
-
-    val_str = str(val_str)
-
-    # 1. Handle "±" specifically: Split by it and take the first part
-    if '±' in val_str:
-        val_str = val_str.split('±')[0]
-
-    # 2. Simple regex to find the first valid number (integer or float) in the remaining string
-    # This matches optional +/- sign, digits, optional dot, digits.
-    match = re.search(r"[-+]?\d*\.?\d+", val_str)
-    if match:
-        return float(match.group())
-
-    return None
+        buffer = io.BytesIO()
+        result.to_excel(buffer, index=False)
+        st.download_button("Download Results", buffer.getvalue(), file_name=f"{stem}_results.xlsx",
+                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                           key=f"{key}_bulk_download")
 
 
 # --- NAVIGATION & HEADER (Top Layout) ---
@@ -305,7 +465,27 @@ with top_left:
     st.title("Cardiokinetics")
     # Search bar placed below title, size restricted by column width (1/3 of page)
     search_term = st.text_input(
-        "Search", placeholder="Search by Drug Name or Class...", label_visibility="collapsed")
+        "Search", placeholder="Search by Drug Name, Brand or Class...", label_visibility="collapsed")
+    if len(catalog) > 1:
+        # Active formulary (e.g. one workbook per ward); each loads the first time it is picked
+        st.selectbox("Dataset", list(catalog), key="dataset_source")
+    with st.expander("Patient Covariates", expanded=patient_key is not None):
+        st.toggle("Adjust PK parameters for this patient", value=False, key="patient_enabled")
+        cov_col1, cov_col2 = st.columns(2)
+        cov_col1.number_input("Weight (kg)", min_value=1.0, max_value=300.0,
+                              value=DEFAULT_COVARIATES["weight"], key="patient_weight")
+        cov_col2.number_input("Age (years)", min_value=18, max_value=120,
+                              value=DEFAULT_COVARIATES["age"], step=1, key="patient_age")
+        cov_col1.selectbox("Sex", SEXES, key="patient_sex")
+        cov_col2.number_input("Serum Creatinine (mg/dL)", min_value=0.1, max_value=20.0,
+                              value=DEFAULT_COVARIATES["scr"], step=0.1, key="patient_scr")
+        st.selectbox("Hepatic Impairment", list(HEPATIC_CLASSES), key="patient_hepatic")
+        st.caption(f"CrCl (Cockcroft-Gault): {patient_crcl(patient):.0f} mL/min. Scales Vd, CL, t½ "
+                   "and AUC in graphs, calculators and class comparisons; tables show the workbook values.")
+
+# Ranked row positions for the global search (typo tolerant, shared by all views)
+search_positions = search_rows(
+    data_signature, search_term, dataset["search_index"]) if search_term else None
 
 with top_right:
     # Spacer to align buttons slightly lower, matching the visual weight of the left side
@@ -336,56 +516,145 @@ st.markdown("---")
 
 view_option = st.session_state.current_view
 
+# --- PAGED TABLES ---
+# Sorting and filtering run here on row positions; only the rows and columns of the visible page
+# are sliced out of the shared table and serialized for the browser.
+
+PAGE_SIZES = [25, 50, 100, 250, 500]
+ORIGINAL_ORDER = "(Relevance / file order)"
+
+
+@counted_cache(st.cache_data, max_entries=64)
+def sorted_ranks(signature, source, column, descending, _data, _numeric):
+    # Cached per dataset version and sort column (the tables themselves are not hashed)
+    return sort_ranks(_data, _numeric, column, descending)
+
+
+def show_page(positions, key, columns, page_size):
+    # One page of df (rows at positions, in that order); the pager appears when there are more
+    start, stop = 0, len(positions)
+    if len(positions) > page_size:
+        pages = page_bounds(len(positions), 1, page_size)[2]
+        page = st.number_input(f"Page (of {pages})", min_value=1, value=1, step=1, key=f"{key}_page")
+        start, stop, _ = page_bounds(len(positions), int(page), page_size)
+    st.caption(f"Showing {start + 1 if stop else 0}–{stop} of {len(positions)} records")
+    page_rows = df.iloc[positions[start:stop]][columns]
+    with pk_profiling.span(f"table send:{key}"):
+        st.dataframe(page_rows, use_container_width=True, hide_index=True,
+                     height=min(800, 35 * (len(page_rows) + 1) + 3))
+
+
 # --- VIEW 1: TABLE VIEW ---
-if view_option == "Table View":
 
+@st.fragment
+@profiled_fragment
+def table_view():
     if not df.empty:
-        # Use the global search_term defined in the top layout
-        if search_term:
-            filtered_df = df[
-                df['Name'].astype(str).str.contains(search_term, case=False) |
-                df['Class'].astype(str).str.contains(search_term, case=False)
-            ]
-        else:
-            filtered_df = df
+        # Use the global search ranking from the top layout, else the file order
+        positions = search_positions if search_term else np.arange(len(df))
 
-        st.write(f"Showing {len(filtered_df)} records")
-        # Added height=800 to make the table significantly taller
-        st.dataframe(filtered_df, use_container_width=True,
-                     hide_index=True, height=800)
+        col1, col2, col3, col4 = st.columns([3, 3, 1, 1])
+        with col1:
+            class_filter = st.multiselect("Filter by Class", list(dataset["class_groups"]), format_func=str,
+                                          key="table_classes", persist_state="page")
+        with col2:
+            sort_column = st.selectbox("Sort by", [ORIGINAL_ORDER] + list(df.columns),
+                                       key="table_sort", persist_state="page")
+        with col3:
+            descending = st.toggle("Descending", key="table_desc", persist_state="page")
+        with col4:
+            page_size = st.selectbox("Rows per page", PAGE_SIZES, index=2,
+                                     key="table_page_size", persist_state="page")
+        columns = st.multiselect("Columns", list(df.columns), default=list(df.columns),
+                                 key="table_columns", persist_state="page") or list(df.columns)
+
+        if class_filter:
+            selected = np.concatenate([dataset["class_groups"][c] for c in class_filter])
+            positions = positions[np.isin(positions, selected)]
+        if sort_column != ORIGINAL_ORDER:
+            ranks = sorted_ranks(numeric_signature, dataset_source, sort_column, descending,
+                                 df, numeric_df)
+            positions = positions[np.argsort(ranks[positions], kind="stable")]
+
+        show_page(positions, "table", columns, page_size)
     else:
         st.info("No data available to display in table.")
 
+
 # --- VIEW 2: DRUGS BY CLASS ---
-elif view_option == "Drugs by Class":
+
+def class_exposure_table(positions):
+    # Exposure metrics of one class, indexed by drug label
+    metrics = exposure_metrics(df, numeric_df, df.index[positions])
+    label_of = pd.Series(drug_labels.index, index=drug_labels.to_numpy())
+    return metrics.set_axis(label_of[metrics.index].to_numpy()).rename_axis("Drug")
+
+
+def class_heatmap_chart(metrics):
+    # One cell per drug x metric: color = log2(value / class median of that metric), text = value
+    cells = metrics.reset_index().melt(
+        id_vars="Drug", var_name="Metric", value_name="Value")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = np.log2(cells["Value"] / cells.groupby("Metric")["Value"].transform("median"))
+    cells["vs Class Median (log2)"] = relative.clip(-3, 3)
+
+    base = alt.Chart(cells).encode(
+        x=alt.X("Metric:N", sort=list(metrics.columns), title=None,
+                axis=alt.Axis(labelAngle=-30, labelLimit=200)),
+        y=alt.Y("Drug:N", sort=list(metrics.index), title=None),
+    )
+    heat = base.mark_rect().encode(
+        color=alt.Color("vs Class Median (log2):Q", scale=alt.Scale(scheme="redblue", reverse=True, domain=[-3, 3])),
+        tooltip=["Drug", "Metric", alt.Tooltip("Value:Q", format=".3g")],
+    )
+    text = base.mark_text(fontSize=12, color="#000000").encode(
+        text=alt.Text("Value:Q", format=".3g"))
+    return (heat + text).properties(height=max(120, 28 * len(metrics)))
+
+
+@st.fragment
+@profiled_fragment
+def drugs_by_class_view():
     st.header("Therapeutic Class Overview")
 
     if not df.empty:
-        drug_classes = df['Class'].unique()
-
-        for drug_class in drug_classes:
-            class_subset = df[df['Class'] == drug_class]
-            count = len(class_subset)
-
-            with st.expander(f"**{drug_class}** ({count} Drugs)"):
-                # Show all columns except Class (since we are already in that group)
-                display_cols = [
-                    c for c in class_subset.columns if c != 'Class']
-                st.dataframe(class_subset[display_cols],
-                             hide_index=True, use_container_width=True)
+        # Row positions per class, partitioned once per dataset version
+        class_groups = dataset["class_groups"]
+
+        with st.container(border=True):
+            st.subheader("Class Exposure Comparison")
+            compare_class = st.selectbox(
+                "Therapeutic class", list(class_groups), format_func=str, key="class_compare",
+                persist_state="page")
+            metrics = class_exposure_table(class_groups[compare_class])
+            chart_key = ("class_heatmap", dataset_source,
+                         numeric_signature, str(compare_class))
+            show_chart(cached_chart_spec(
+                chart_key, lambda: class_heatmap_chart(metrics)))
+            st.caption("Dose-normalized exposure and accumulation ratio R = 1 / (1 − e^(−kτ)) at standard "
+                       "intervals. Colors compare each drug with the class median (red above, blue below).")
+
+        # Show all columns except Class (since we are already in that group)
+        display_cols = [c for c in df.columns if c != 'Class']
+        for i, (drug_class, positions) in enumerate(class_groups.items()):
+            with st.expander(f"**{drug_class}** ({len(positions)} Drugs)"):
+                show_page(positions, f"class_{i}", display_cols, PAGE_SIZES[0])
     else:
         st.info("No data available to display classes.")
 
+
 # --- VIEW 3: INDIVIDUAL VIEW ---
-elif view_option == "Individual Drug View":
+
+@st.fragment
+@profiled_fragment
+def individual_view():
     st.header("Individual Pharmacokinetic Profile")
 
     if not df.empty:
         # Optional: Filter the dropdown list if a search term is present
         # This makes the global search bar useful in this view as well
         if search_term:
-            filtered_names = df[df['Name'].astype(str).str.contains(
-                search_term, case=False)]['Name'].unique()
+            filtered_names = df['Name'].iloc[search_positions].unique()
             if len(filtered_names) == 0:
                 st.warning(f"No drugs found matching '{search_term}'")
                 filtered_names = df['Name'].unique()
@@ -416,244 +685,895 @@ elif view_option == "Individual Drug View":
                 val = drug[param]
                 # Use the column index to place metrics in the grid (0, 1, 2, 0, 1, 2...)
                 with cols[i % 3]:
-                    st.metric(label=param, value=str(val))
+                    st.metric(label=param, value="N/A" if pd.isna(val) else str(val))
 
     else:
         st.info("No data available to display individual profiles.")
 
+
 # --- VIEW 4: PK CALCULATOR ---
-elif view_option == "PK Calculator":
-    st.header("Pharmacokinetic Calculator")
-    st.markdown(
-        "Estimate missing parameters using standard one-compartment models.")
+# Each calculator tab is its own fragment and only the open tab is built; its inputs use
+# persist_state="page" so they keep their values while another tab is open.
 
-    # Create tabs for different calculators
-    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(
-        ["Bioavailability (F)", "Cmin (Trough)", "Clearance (CL)", "Half-Life / ke", "Steady State", "Therapeutic Window"])
+# --- CALCULATOR 1: BIOAVAILABILITY ---
 
-    # --- CALCULATOR 1: BIOAVAILABILITY ---
-    with tab1:
-        st.subheader("Calculate Bioavailability (F)")
+@st.fragment
+@profiled_fragment
+def bioavailability_tab():
+    st.subheader("Calculate Bioavailability (F)")
 
-        # Display Equation
-        st.latex(
-            r"F = \frac{AUC_{oral} \cdot Dose_{IV}}{AUC_{IV} \cdot Dose_{oral}}")
-        st.write("Determine absolute bioavailability by comparing Oral vs. IV data.")
+    # Display Equation
+    st.latex(
+        r"F = \frac{AUC_{oral} \cdot Dose_{IV}}{AUC_{IV} \cdot Dose_{oral}}")
+    st.write("Determine absolute bioavailability by comparing Oral vs. IV data.")
 
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown("**Oral Administration**")
-            auc_oral = st.number_input(
-                "AUC (Oral)", min_value=0.0, value=0.0, step=0.1, key="bio_auc_oral")
-            dose_oral = st.number_input(
-                "Dose (Oral)", min_value=0.0, value=0.0, step=1.0, key="bio_dose_oral")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Oral Administration**")
+        auc_oral = st.number_input(
+            "AUC (Oral)", min_value=0.0, value=0.0, step=0.1, key="bio_auc_oral", persist_state="page")
+        dose_oral = st.number_input(
+            "Dose (Oral)", min_value=0.0, value=0.0, step=1.0, key="bio_dose_oral", persist_state="page")
 
-        with col2:
-            st.markdown("**IV Administration**")
-            auc_iv = st.number_input(
-                "AUC (IV)", min_value=0.0, value=0.0, step=0.1, key="bio_auc_iv")
-            dose_iv = st.number_input(
-                "Dose (IV)", min_value=0.0, value=0.0, step=1.0, key="bio_dose_iv")
+    with col2:
+        st.markdown("**IV Administration**")
+        auc_iv = st.number_input(
+            "AUC (IV)", min_value=0.0, value=0.0, step=0.1, key="bio_auc_iv", persist_state="page")
+        dose_iv = st.number_input(
+            "Dose (IV)", min_value=0.0, value=0.0, step=1.0, key="bio_dose_iv", persist_state="page")
+
+    st.markdown("<br>", unsafe_allow_html=True)  # Extra spacing
+    if st.button("Calculate F", use_container_width=True, key="bio_calc_btn"):
+        if dose_oral > 0 and auc_iv > 0 and dose_iv > 0:
+            # F = (AUC_oral * Dose_iv) / (AUC_iv * Dose_oral)
+            f_absolute = float(pk_calc.bioavailability(
+                auc_oral, dose_oral, auc_iv, dose_iv))
+            f_percent = f_absolute * 100
+            st.success(
+                f"**Bioavailability (F):** {f_absolute:.4f} ({f_percent:.2f}%)")
+        else:
+            st.error("Please enter non-zero values for Doses and IV AUC.")
 
-        st.markdown("<br>", unsafe_allow_html=True)  # Extra spacing
-        if st.button("Calculate F", use_container_width=True, key="bio_calc_btn"):
-            if dose_oral > 0 and auc_iv > 0 and dose_iv > 0:
-                # F = (AUC_oral * Dose_iv) / (AUC_iv * Dose_oral)
-                f_absolute = (auc_oral * dose_iv) / (auc_iv * dose_oral)
-                f_percent = f_absolute * 100
-                st.success(
-                    f"**Bioavailability (F):** {f_absolute:.4f} ({f_percent:.2f}%)")
-            else:
-                st.error("Please enter non-zero values for Doses and IV AUC.")
+    bulk_mode("Bioavailability (F)", "bio")
 
-    # --- CALCULATOR 2: CMIN (TROUGH) ---
-    with tab2:
-        st.subheader("Estimate Cmin (Trough Concentration)")
 
-        # Display Equation
-        st.latex(
-            r"C_{min} = C_{max} \cdot e^{-k_e \cdot t} \quad \text{where} \quad k_e = \frac{0.693}{t_{1/2}}")
-        st.write(
-            "Calculate the expected concentration at the end of a dosing interval based on the peak.")
+# --- CALCULATOR 2: CMIN (TROUGH) ---
 
-        cmax = st.number_input("Cmax (Peak Concentration)",
-                               min_value=0.0, value=100.0, key="cmin_cmax")
-        t_half = st.number_input(
-            "Half-Life (t½ in hours)", min_value=0.1, value=12.0, key="cmin_thalf")
-        interval = st.number_input(
-            "Time since peak / Dosing Interval (hours)", min_value=0.0, value=24.0, key="cmin_interval")
+@st.fragment
+@profiled_fragment
+def trough_tab():
+    st.subheader("Estimate Cmin (Trough Concentration)")
 
-        st.markdown("<br>", unsafe_allow_html=True)  # Extra spacing
-        if st.button("Calculate Cmin", use_container_width=True, key="cmin_calc_btn"):
-            if t_half > 0:
-                # Calculate elimination rate constant (k)
-                k = 0.693 / t_half
-                # Calculate Cmin = Cmax * e^(-k * t)
-                cmin = cmax * math.exp(-k * interval)
-
-                st.info(f"Elimination Rate Constant (k): {k:.4f} /h")
-                st.success(f"**Estimated Trough (Cmin):** {cmin:.2f}")
-            else:
-                st.error("Half-life must be greater than 0.")
+    # Display Equation
+    st.latex(
+        r"C_{min} = C_{max} \cdot e^{-k_e \cdot t} \quad \text{where} \quad k_e = \frac{0.693}{t_{1/2}}")
+    st.write(
+        "Calculate the expected concentration at the end of a dosing interval based on the peak.")
+
+    cmax = st.number_input("Cmax (Peak Concentration)",
+                           min_value=0.0, value=100.0, key="cmin_cmax", persist_state="page")
+    t_half = st.number_input(
+        "Half-Life (t½ in hours)", min_value=0.1, value=12.0, key="cmin_thalf", persist_state="page")
+    interval = st.number_input(
+        "Time since peak / Dosing Interval (hours)", min_value=0.0, value=24.0, key="cmin_interval", persist_state="page")
+
+    st.markdown("<br>", unsafe_allow_html=True)  # Extra spacing
+    if st.button("Calculate Cmin", use_container_width=True, key="cmin_calc_btn"):
+        if t_half > 0:
+            # Calculate k = 0.693 / t½ and Cmin = Cmax * e^(-k * t)
+            k, cmin = (float(v) for v in pk_calc.trough_concentration(
+                cmax, t_half, interval))
+
+            st.info(f"Elimination Rate Constant (k): {k:.4f} /h")
+            st.success(f"**Estimated Trough (Cmin):** {cmin:.2f}")
+        else:
+            st.error("Half-life must be greater than 0.")
+
+    bulk_mode("Cmin (Trough)", "cmin")
+
+
+# --- CALCULATOR 3: CLEARANCE ---
+
+@st.fragment
+@profiled_fragment
+def clearance_tab():
+    st.subheader("Calculate Clearance (CL)")
+
+    # Display Equation
+    st.latex(r"CL = \frac{F \cdot Dose}{AUC}")
+    st.write("Calculate Total Clearance from Bioavailability, Dose, and AUC.")
+
+    dose_col, dose_unit_col = st.columns([3, 1])
+    cl_dose = dose_col.number_input(
+        "Dose", min_value=0.0, value=500.0, key="cl_dose", persist_state="page")
+    cl_dose_unit = dose_unit_col.selectbox(
+        "Dose Unit", ["mg", "µg", "g"], key="cl_dose_unit", persist_state="page")
+    cl_f = st.number_input("Bioavailability (F) [0 to 1]", min_value=0.0, max_value=1.0,
+                           value=1.0, step=0.05, help="Use 1.0 for IV administration", key="cl_f", persist_state="page")
+    auc_col, auc_unit_col = st.columns([3, 1])
+    cl_auc = auc_col.number_input(
+        "AUC", min_value=0.0, value=100.0, key="cl_auc", persist_state="page")
+    cl_auc_unit = auc_unit_col.selectbox(
+        "AUC Unit", ["mg·h/L", "µg·h/mL", "ng·h/mL", "µg·h/L"], key="cl_auc_unit", persist_state="page")
+
+    st.markdown("<br>", unsafe_allow_html=True)  # Extra spacing
+    if st.button("Calculate CL", use_container_width=True, key="cl_calc_btn"):
+        if cl_auc > 0:
+            # CL = (F * Dose) / AUC, with Dose in mg and AUC in mg·h/L -> L/h
+            clearance = float(pk_calc.clearance(
+                convert(cl_dose, cl_dose_unit, "mg"), cl_f, convert(cl_auc, cl_auc_unit, "mg·h/L")))
+            st.success(f"**Clearance (CL):** {clearance:.2f} L/h "
+                       f"({float(convert(clearance, 'L/h', 'mL/min')):.1f} mL/min)")
+        else:
+            st.error("AUC must be greater than 0.")
+
+    bulk_mode("Clearance (CL)", "cl")
 
-    # --- CALCULATOR 3: CLEARANCE ---
-    with tab3:
-        st.subheader("Calculate Clearance (CL)")
 
-        # Display Equation
-        st.latex(r"CL = \frac{F \cdot Dose}{AUC}")
-        st.write("Calculate Total Clearance from Bioavailability, Dose, and AUC.")
+# --- CALCULATOR 4: HALF-LIFE / KE ---
 
-        cl_dose = st.number_input(
-            "Dose (mg)", min_value=0.0, value=500.0, key="cl_dose")
-        cl_f = st.number_input("Bioavailability (F) [0 to 1]", min_value=0.0, max_value=1.0,
-                               value=1.0, step=0.05, help="Use 1.0 for IV administration", key="cl_f")
-        cl_auc = st.number_input(
-            "AUC (mg·h/L)", min_value=0.0, value=100.0, key="cl_auc")
+@st.fragment
+@profiled_fragment
+def half_life_tab():
+    st.subheader("Half-Life ↔ Elimination Constant Converter")
 
+    # Display Equation
+    st.latex(r"t_{1/2} = \frac{\ln(2)}{k_e} \approx \frac{0.693}{k_e}")
+
+    calc_mode = st.radio("I want to calculate:", [
+                         "Half-Life (t½)", "Elimination Constant (k)"], key="hl_calc_mode", persist_state="page")
+
+    if calc_mode == "Half-Life (t½)":
+        k_input = st.number_input(
+            "Enter Elimination Constant (k) [1/h]", min_value=0.0001, value=0.1, format="%.4f", key="hl_k_input", persist_state="page")
         st.markdown("<br>", unsafe_allow_html=True)  # Extra spacing
-        if st.button("Calculate CL", use_container_width=True, key="cl_calc_btn"):
-            if cl_auc > 0:
-                # CL = (F * Dose) / AUC
-                clearance = (cl_f * cl_dose) / cl_auc
-                st.success(f"**Clearance (CL):** {clearance:.2f} L/h")
-            else:
-                st.error("AUC must be greater than 0.")
+        if st.button("Convert to t½", use_container_width=True, key="hl_calc_btn1"):
+            t_half_calc = float(pk_calc.half_life_from_k(k_input))
+            st.success(f"**Half-Life:** {t_half_calc:.2f} hours")
 
-    # --- CALCULATOR 4: HALF-LIFE / KE ---
-    with tab4:
-        st.subheader("Half-Life ↔ Elimination Constant Converter")
+    else:
+        t_input = st.number_input(
+            "Enter Half-Life (t½) [hours]", min_value=0.1, value=12.0, key="hl_t_input", persist_state="page")
+        st.markdown("<br>", unsafe_allow_html=True)  # Extra spacing
+        if st.button("Convert to k", use_container_width=True, key="hl_calc_btn2"):
+            k_calc = float(pk_calc.k_from_half_life(t_input))
+            st.success(f"**Elimination Constant (k):** {k_calc:.4f} /h")
 
-        # Display Equation
-        st.latex(r"t_{1/2} = \frac{\ln(2)}{k_e} \approx \frac{0.693}{k_e}")
+    bulk_mode(calc_mode, "hl")
 
-        calc_mode = st.radio("I want to calculate:", [
-                             "Half-Life (t½)", "Elimination Constant (k)"], key="hl_calc_mode")
 
-        if calc_mode == "Half-Life (t½)":
-            k_input = st.number_input(
-                "Enter Elimination Constant (k) [1/h]", min_value=0.0001, value=0.1, format="%.4f", key="hl_k_input")
-            st.markdown("<br>", unsafe_allow_html=True)  # Extra spacing
-            if st.button("Convert to t½", use_container_width=True, key="hl_calc_btn1"):
-                t_half_calc = 0.693 / k_input
-                st.success(f"**Half-Life:** {t_half_calc:.2f} hours")
+# --- CALCULATOR 5: STEADY STATE ---
 
-        else:
-            t_input = st.number_input(
-                "Enter Half-Life (t½) [hours]", min_value=0.1, value=12.0, key="hl_t_input")
-            st.markdown("<br>", unsafe_allow_html=True)  # Extra spacing
-            if st.button("Convert to k", use_container_width=True, key="hl_calc_btn2"):
-                k_calc = 0.693 / t_input
-                st.success(f"**Elimination Constant (k):** {k_calc:.4f} /h")
-
-    # --- CALCULATOR 5: STEADY STATE ---
-    with tab5:
-        st.subheader("Steady State Simulator")
-        st.markdown(
-            "Estimate peak, trough, and average concentrations at steady state ($C_{ss}$).")
-
-        col1, col2 = st.columns(2)
-        with col1:
-            ss_dose = st.number_input(
-                "Dose (mg)", min_value=0.0, value=100.0, key="ss_dose")
-            ss_interval = st.number_input(
-                "Dosing Interval (τ in hours)", min_value=1.0, value=24.0, key="ss_interval")
-        with col2:
-            ss_thalf = st.number_input(
-                "Half-Life (t½ in hours)", min_value=0.1, value=12.0, key="ss_thalf")
-            ss_vd = st.number_input(
-                "Volume of Distribution (Vd in L)", min_value=0.1, value=50.0, key="ss_vd")
-
-        st.markdown("<br>", unsafe_allow_html=True)
-        if st.button("Simulate Steady State", use_container_width=True, key="ss_calc_btn"):
-            if ss_thalf > 0 and ss_vd > 0:
-                k = 0.693 / ss_thalf
-
-                # Equations
-                # Cmax_ss = (Dose / Vd) * (1 / (1 - e^-kτ))
-                accumulation_factor = 1 / (1 - math.exp(-k * ss_interval))
-                cmax_ss = (ss_dose / ss_vd) * accumulation_factor
-                cmin_ss = cmax_ss * math.exp(-k * ss_interval)
-                cavg_ss = (ss_dose / ss_vd) / \
-                    (k * ss_interval)  # Or AUC_tau / tau
-
-                # Display Metrics
-                m1, m2, m3 = st.columns(3)
-                m1.metric("Peak (Cmax,ss)", f"{cmax_ss:.2f} mg/L")
-                m2.metric("Trough (Cmin,ss)", f"{cmin_ss:.2f} mg/L")
-                m3.metric("Average (Cavg,ss)", f"{cavg_ss:.2f} mg/L")
-
-                # Plot Accumulation (5 Doses)
-                time_points = []
-                concs = []
-                current_conc = 0
-                total_time = ss_interval * 5
-
-                # Simplified Simulation Loop
-                sim_times = []
-                sim_concs = []
-                c = 0
-                for i in range(5):  # 5 doses
-                    # Instantaneous peak addition
-                    c += (ss_dose / ss_vd)
-
-                    # Decay over interval
-                    t_start = i * ss_interval
-                    for t_step in np.linspace(0, ss_interval, 20):
-                        sim_times.append(t_start + t_step)
-                        sim_concs.append(c * math.exp(-k * t_step))
-
-                    # Trough before next dose
-                    c = c * math.exp(-k * ss_interval)
-
-                chart_df = pd.DataFrame(
-                    {"Time (h)": sim_times, "Conc": sim_concs})
-
-                # Altair Chart
-                ss_chart = alt.Chart(chart_df).mark_line(color="#FFFFFF", strokeWidth=2).encode(
-                    x='Time (h)', y='Conc'
-                ).properties(background='#003366', height=300).configure_axis(
-                    labelColor='#FFFFFF', titleColor='#FFFFFF', gridColor='#406080'
-                ).configure_view(stroke=None)
-
-                st.altair_chart(ss_chart, use_container_width=True)
+@st.fragment
+@profiled_fragment
+def steady_state_tab():
+    st.subheader("Steady State Simulator")
+    st.markdown(
+        "Estimate peak, trough, and average concentrations at steady state ($C_{ss}$).")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        ss_dose = st.number_input(
+            "Dose (mg)", min_value=0.0, value=100.0, key="ss_dose", persist_state="page")
+        ss_interval = st.number_input(
+            "Dosing Interval (τ in hours)", min_value=1.0, value=24.0, key="ss_interval", persist_state="page")
+    with col2:
+        ss_thalf = st.number_input(
+            "Half-Life (t½ in hours)", min_value=0.1, value=12.0, key="ss_thalf", persist_state="page")
+        ss_vd = st.number_input(
+            "Volume of Distribution (Vd in L)", min_value=0.1, value=50.0, key="ss_vd", persist_state="page")
+
+    ss_model = st.selectbox(
+        "PK Model", list(PK_MODELS), key="ss_model", persist_state="page")
+    if "ka" in PK_MODELS[ss_model]["params"]:
+        ss_f = st.number_input("Bioavailability (F) [0 to 1]", min_value=0.0, max_value=1.0,
+                               value=1.0, step=0.05, key="ss_f", persist_state="page")
+    else:
+        ss_f = 1.0
+    ss_options = model_option_inputs(ss_model, "ss")
+
+    col3, col4 = st.columns(2)
+    with col3:
+        ss_n_doses = st.number_input(
+            "Number of Doses to Simulate", min_value=1, max_value=5000, value=5, step=1, key="ss_n_doses", persist_state="page")
+    with col4:
+        ss_resolution = st.number_input(
+            "Points per Dosing Interval (0 = adaptive)", min_value=0, max_value=5000, value=0, step=1,
+            key="ss_resolution", persist_state="page")
+
+    with st.expander("Irregular Schedule (Missed / Late Doses)", expanded=False):
+        ss_missed_text = st.text_input(
+            "Missed doses", placeholder="Dose numbers, e.g. 3, 7", key="ss_missed", persist_state="page")
+        ss_late_text = st.text_input(
+            "Late doses", placeholder="Dose number:hours late, e.g. 4:2.5, 9:1", key="ss_late", persist_state="page")
+
+    st.markdown("<br>", unsafe_allow_html=True)
+    if st.button("Simulate Steady State", use_container_width=True, key="ss_calc_btn"):
+        if ss_thalf > 0 and ss_vd > 0:
+            k = 0.693 / ss_thalf
+
+            # Model parameters per mg of dose (C0 = F / Vd)
+            ss_params = {"c0": ss_f / ss_vd, "k": k, "ka": ss_options["ka"] or DEFAULT_KA,
+                         "tlag": ss_options["tlag"], "alpha": k * ss_options["alpha_ratio"],
+                         "frac_alpha": ss_options["frac_alpha"]}
+
+            # Equations (IV bolus)
+            # Cmax_ss = (Dose / Vd) * (1 / (1 - e^-kτ)), Cmin_ss = Cmax_ss * e^-kτ, Cavg_ss = AUC / τ
+            # The same accumulation applies to every exponential term of the other models
+            cmax_ss, cmin_ss, cavg_ss = (
+                ss_dose * m for m in steady_state_metrics(ss_model, ss_params, ss_interval))
+
+            # Display Metrics
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Peak (Cmax,ss)", f"{cmax_ss:.2f} mg/L")
+            m2.metric("Trough (Cmin,ss)", f"{cmin_ss:.2f} mg/L")
+            m3.metric("Average (Cavg,ss)", f"{cavg_ss:.2f} mg/L")
+
+            # Plot Accumulation (superposition over the requested schedule)
+            try:
+                dose_times, dose_amounts = dosing_schedule(
+                    ss_dose, ss_interval, int(ss_n_doses),
+                    missed=parse_dose_numbers(ss_missed_text),
+                    delays=parse_dose_delays(ss_late_text))
+            except ValueError:
+                dose_times = None
+                st.error(
+                    "Could not read the missed/late dose lists. Use e.g. '3, 7' and '4:2.5'.")
+
+            if dose_times is not None:
+                def build_ss_chart():
+                    sim_times, sim_concs = superposition_profile(
+                        dose_times, dose_amounts, ss_model, ss_params,
+                        points_per_interval=int(ss_resolution) if ss_resolution > 1 else None,
+                        end_time=dose_times[-1] + ss_interval)
+
+                    keep = lttb_indices(sim_times, sim_concs)
+                    chart_df = pd.DataFrame(
+                        {"Time (h)": sim_times[keep], "Conc": sim_concs[keep]})
+
+                    # Altair Chart
+                    return alt.Chart(chart_df).mark_line(color="#FFFFFF", strokeWidth=2).encode(
+                        x='Time (h)', y='Conc'
+                    ).properties(background='#003366', height=300).configure_axis(
+                        labelColor='#FFFFFF', titleColor='#FFFFFF', gridColor='#406080'
+                    ).configure_view(stroke=None)
+
+                chart_key = ("steady_state", ss_model, tuple(sorted(ss_params.items())), ss_dose, ss_interval,
+                             int(ss_n_doses), int(ss_resolution), ss_missed_text, ss_late_text)
+                show_chart(cached_chart_spec(chart_key, build_ss_chart))
                 st.caption(
-                    "Simulation of accumulation over 5 dosing intervals.")
+                    f"Simulation of accumulation over {int(ss_n_doses)} dosing intervals.")
+
+        else:
+            st.error("Half-life and Vd must be > 0.")
+
+    st.caption("Bulk mode uses the one-compartment IV bolus equations.")
+    bulk_mode("Steady State", "ss")
+
+
+# --- CALCULATOR 6: THERAPEUTIC WINDOW ---
+
+@st.fragment
+@profiled_fragment
+def therapeutic_window_tab():
+    st.subheader("Therapeutic Window Checker")
+    st.markdown(
+        "Check if a measured concentration falls within the safe therapeutic range.")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        measured_conc = st.number_input(
+            "Measured Concentration", min_value=0.0, value=25.0, key="tw_measured", persist_state="page")
+    with col2:
+        min_therapeutic = st.number_input(
+            "Min Therapeutic Level", min_value=0.0, value=10.0, key="tw_min", persist_state="page")
+    with col3:
+        max_therapeutic = st.number_input(
+            "Max Therapeutic Level", min_value=0.0, value=30.0, key="tw_max", persist_state="page")
+
+    st.markdown("<br>", unsafe_allow_html=True)
+    if st.button("Check Status", use_container_width=True, key="tw_check_btn"):
+        status = str(pk_calc.therapeutic_status(
+            measured_conc, min_therapeutic, max_therapeutic))
+        if status == "Sub-therapeutic":
+            st.warning(
+                f"⚠️ **Sub-therapeutic**: {measured_conc} is below the effective range ({min_therapeutic}-{max_therapeutic}).")
+        elif status == "Toxic":
+            st.error(
+                f"🚨 **Toxic**: {measured_conc} is above the safe range ({min_therapeutic}-{max_therapeutic}).")
+        else:
+            st.success(
+                f"✅ **Therapeutic**: {measured_conc} is within the target range ({min_therapeutic}-{max_therapeutic}).")
+
+    bulk_mode("Therapeutic Window", "tw")
+
+
+# --- CALCULATOR 7: REGIMEN FINDER ---
+
+def drug_regimen_defaults(idx):
+    # Half-life, Vd (with its unit code), F and target window (mg/L) from the drug table
+    vd_col = find_column(df.columns, "volume", None)
+    bio_col = find_column(df.columns, "bioavail", None)
+    vd_unit = numeric_df.at[idx, (vd_col, "unit")] if vd_col is not None else None
+    f = lookup_numeric(idx, bio_col) if bio_col is not None else None  # Fraction (see pk_units)
+    cmin = lookup_numeric(idx, find_column(df.columns, "cmin", "Cmin"))
+    cmax = lookup_numeric(idx, find_column(df.columns, "cmax", "Cmax"))
+    return {
+        "t_half": lookup_numeric(idx, find_column(df.columns, "half", "Half-Life")),
+        "vd": lookup_numeric(idx, vd_col) if vd_col is not None else None,
+        "vd_per_kg": vd_unit == "L/kg",
+        "f": min(max(f, 0.0), 1.0) if f is not None else None,
+        # Reported levels are ng/mL (canonical unit), the steady-state equations work in mg/L
+        "min": float(convert(cmin, "ng/mL", "mg/L")) if cmin else None,
+        "max": float(convert(cmax, "ng/mL", "mg/L")) if cmax else None,
+    }
+
+
+@st.fragment
+@profiled_fragment
+def regimen_finder_tab():
+    st.subheader("Dosing Regimen Finder")
+    st.markdown(
+        "Search every dose × interval combination for regimens whose steady-state peak and trough "
+        "stay inside a target window.")
+    st.latex(r"C_{max,ss} = \frac{F \cdot Dose / V_d}{1 - e^{-k\tau}} \le C_{max}, \quad "
+             r"C_{min,ss} = C_{max,ss} \cdot e^{-k\tau} \ge C_{min}")
+
+    drug_options = ["Manual entry"] + list(drug_labels.index)
+    rg_drug = st.selectbox("Prefill from drug", drug_options,
+                           key="rg_drug", persist_state="page")
+    defaults = {"t_half": None, "vd": None, "vd_per_kg": False, "f": None, "min": None, "max": None}
+    if rg_drug != "Manual entry":
+        defaults = drug_regimen_defaults(drug_labels[rg_drug])
+    # Widget keys include the drug (and patient covariates) so picking another drug loads its values
+    suffix = "" if rg_drug == "Manual entry" else f"_{drug_labels[rg_drug]}"
+    if patient_key and suffix:
+        suffix += f"_{hash(patient_key) & 0xFFFFFFFF:08x}"
+
+    col1, col2 = st.columns(2)
+    with col1:
+        rg_thalf = st.number_input("Half-Life (t½ in hours)", min_value=0.1, value=defaults["t_half"] or 12.0,
+                                   key=f"rg_thalf{suffix}", persist_state="page")
+        vd_label = "Volume of Distribution (Vd in L/kg)" if defaults["vd_per_kg"] else \
+            "Volume of Distribution (Vd in L)"
+        rg_vd = st.number_input(vd_label, min_value=0.01, value=defaults["vd"] or 50.0,
+                                key=f"rg_vd{suffix}", persist_state="page")
+        if defaults["vd_per_kg"]:
+            rg_vd *= st.number_input("Body Weight (kg)", min_value=1.0, value=70.0,
+                                     key="rg_weight", persist_state="page")
+        rg_f = st.number_input("Bioavailability (F) [0 to 1]", min_value=0.01, max_value=1.0,
+                               value=defaults["f"] or 1.0, step=0.05, key=f"rg_f{suffix}", persist_state="page")
+    with col2:
+        rg_min = st.number_input("Target Min (Cmin,ss in mg/L)", min_value=0.0, value=defaults["min"] or 1.0,
+                                 format="%.4f", key=f"rg_min{suffix}", persist_state="page")
+        rg_max = st.number_input("Target Max (Cmax,ss in mg/L)", min_value=0.0, value=defaults["max"] or 4.0,
+                                 format="%.4f", key=f"rg_max{suffix}", persist_state="page")
+        rg_max_dose = st.number_input("Largest Dose to Try (mg)", min_value=1.0, value=1000.0,
+                                      key="rg_max_dose", persist_state="page")
+        rg_dose_step = st.number_input("Dose Step (mg)", min_value=0.01, value=5.0,
+                                       key="rg_dose_step", persist_state="page")
+    rg_standard = st.checkbox(f"Standard intervals only ({', '.join(map(str, pk_calc.STANDARD_INTERVALS))} h)",
+                              value=True, key="rg_standard", persist_state="page")
+
+    st.markdown("<br>", unsafe_allow_html=True)
+    if st.button("Find Regimens", use_container_width=True, key="rg_find_btn"):
+        if rg_max <= rg_min:
+            st.error("Target max must be greater than target min.")
+            return
+        doses = np.arange(rg_dose_step, rg_max_dose + rg_dose_step / 2, rg_dose_step)
+        intervals = pk_calc.STANDARD_INTERVALS if rg_standard else np.arange(1, 73)
+        regimens = pk_calc.rank_regimens(
+            rg_thalf, rg_vd, rg_min, rg_max, doses, intervals, f=rg_f)
+
+        st.caption(f"Evaluated {len(doses) * len(intervals):,} regimens "
+                   f"({len(doses):,} doses × {len(intervals)} intervals).")
+        if regimens.empty:
+            tau_max = float(pk_calc.max_interval_for_window(rg_thalf, rg_min, rg_max))
+            st.warning(f"No regimen in the grid keeps the steady state inside {rg_min:g}–{rg_max:g} mg/L. "
+                       f"With t½ = {rg_thalf:g} h the window allows intervals up to {tau_max:.1f} h; "
+                       "try shorter intervals, a finer dose step or a larger maximum dose.")
+        else:
+            best = regimens.iloc[0]
+            st.success(f"**Best regimen:** {best['Dose (mg)']:g} mg every {best['Interval (h)']:g} h "
+                       f"(Cmin,ss {best['Cmin,ss (mg/L)']:.3g} – Cmax,ss {best['Cmax,ss (mg/L)']:.3g} mg/L)")
+            st.dataframe(regimens.head(50), use_container_width=True, hide_index=True)
+
+    st.caption("Uses the one-compartment IV bolus steady-state equations with F × Dose absorbed.")
+
+
+# --- CALCULATOR 8: FIT MEASURED LEVELS ---
+
+FIT_ESTIMATES = ["k (1/h)", "t½ (h)", "Vd (L)", "CL (L/h)"]
+
+
+@st.fragment
+@profiled_fragment
+def fit_levels_tab():
+    st.subheader("Fit Measured Concentrations")
+    st.markdown(
+        "Estimate k, t½, Vd and CL from a patient's measured levels after an IV dose "
+        "(nonlinear least squares on log concentrations, 95% confidence intervals).")
+
+    fit_model = st.selectbox("PK Model", list(FIT_MODELS),
+                             key="fit_model", persist_state="page")
+    col1, col2 = st.columns(2)
+    fit_dose = col1.number_input("Dose (mg)", min_value=0.0, value=500.0,
+                                 key="fit_dose", persist_state="page")
+    fit_unit = col2.selectbox("Concentration Unit", ["mg/L", "µg/mL", "ng/mL"],
+                              key="fit_unit", persist_state="page")
+    fit_text = st.text_area("Samples (one 'time in hours, concentration' pair per line)",
+                            value="0.5, 10\n1, 8.2\n2, 6.7\n4, 4.5\n8, 2.0", height=160,
+                            key="fit_text", persist_state="page")
+
+    st.markdown("<br>", unsafe_allow_html=True)
+    if st.button("Fit Model", use_container_width=True, key="fit_btn"):
+        try:
+            samples = parse_sample_text(fit_text)
+            samples["conc"] = convert(samples["conc"], fit_unit, "mg/L")
+            fit = fit_sample_table(fit_model, samples, dose=fit_dose).iloc[0]
+        except ValueError as e:
+            st.error(f"Could not fit the samples: {e}")
+            return
+
+        if fit["Samples"] < 2 * FIT_MODELS[fit_model]:
+            st.error(f"Too few samples ({fit['Samples']}): the {fit_model} model needs at least "
+                     f"{2 * FIT_MODELS[fit_model]} to be fitted.")
+            return
+        if fit["Samples"] == 2 * FIT_MODELS[fit_model]:
+            st.warning(f"{fit['Samples']} samples: at least {2 * FIT_MODELS[fit_model] + 1} are needed "
+                       "for confidence intervals.")
+        elif not fit["Converged"]:
+            st.warning("The fit did not converge; treat the estimates with caution.")
+
+        metrics = st.columns(len(FIT_ESTIMATES))
+        for metric, name in zip(metrics, FIT_ESTIMATES):
+            metric.metric(name, f"{fit[name]:.3g}")
+            if pd.notna(fit[f"{name} 95% low"]):
+                metric.caption(
+                    f"95% CI {fit[f'{name} 95% low']:.3g} – {fit[f'{name} 95% high']:.3g}")
+
+        # Measured levels over the fitted curve, in the unit they were entered in
+        scale = float(convert(1.0, "mg/L", fit_unit))
+        time_points, fitted = adaptive_time_points(
+            fit_model, fitted_model_params(fit), samples["time"].max() * 1.25)
+        y_title = f"Conc ({fit_unit})"
+        curve = pd.DataFrame({"Time (h)": time_points, y_title: fitted[0] * scale})
+        points = pd.DataFrame({"Time (h)": samples["time"], y_title: samples["conc"] * scale})
+        chart = alt.Chart(curve).mark_line(color="#FFFFFF", strokeWidth=2).encode(
+            x="Time (h)", y=y_title
+        ) + alt.Chart(points).mark_circle(color="red", size=120, opacity=1).encode(
+            x="Time (h)", y=y_title, tooltip=["Time (h)", y_title])
+        show_chart(chart.properties(background='#003366', height=300).configure_axis(
+            labelColor='#FFFFFF', titleColor='#FFFFFF', gridColor='#406080'
+        ).configure_view(stroke=None).to_dict())
+        st.caption(f"Residual SD (log scale): {fit['RMSE (log)']:.3f}")
+
+    with st.expander("Batch Fit (CSV / Excel)", expanded=False):
+        st.write("Upload one row per sample with the columns `patient`, `time`, `conc` (in the unit "
+                 "selected above) and optionally `dose`; the dose above is used where it is missing.")
+        upload = st.file_uploader("Sample file", type=["csv", "xlsx", "xls"], key="fit_bulk_file")
+        if upload is None:
+            return
+        try:
+            table = read_uploaded_table(upload)
+            fits = fit_uploaded_samples(fit_model, table, fit_unit, fit_dose)
+        except Exception as e:
+            st.error(f"Error fitting uploaded file: {e}")
+            return
+
+        st.write(f"Fitted {len(fits)} patients ({int(fits['Converged'].sum())} converged; first 100 shown)")
+        st.dataframe(fits.head(100), hide_index=True, use_container_width=True)
+        download_results(fits, os.path.splitext(upload.name)[0], "fit")
+
+
+def samples_in_mg_per_l(table, unit):
+    # Sample table with its 'conc' column converted from unit to mg/L (the fitting / NCA unit)
+    lookup = {str(c).strip().lower(): c for c in table.columns}
+    if "conc" in lookup:
+        table[lookup["conc"]] = convert(
+            pd.to_numeric(table[lookup["conc"]], errors="coerce"), unit, "mg/L")
+    return table
+
+
+def fit_uploaded_samples(model, table, unit, dose):
+    # Batch fit of an uploaded sample table
+    fits = fit_sample_table(model, samples_in_mg_per_l(table, unit), dose=dose)
+    return fits.drop(columns=[c for c in fits.columns if c.startswith("model_")])
 
-            else:
-                st.error("Half-life and Vd must be > 0.")
 
-    # --- CALCULATOR 6: THERAPEUTIC WINDOW ---
-    with tab6:
-        st.subheader("Therapeutic Window Checker")
-        st.markdown(
-            "Check if a measured concentration falls within the safe therapeutic range.")
+# --- CALCULATOR 9: NON-COMPARTMENTAL ANALYSIS ---
 
+def send_to_calculator(tab, values):
+    # on_click: fill another calculator tab's inputs and open that tab
+    st.session_state.update(values)
+    st.session_state.calc_tab = tab
+
+
+@st.fragment
+@profiled_fragment
+def nca_tab():
+    st.subheader("Non-Compartmental Analysis (NCA)")
+    st.markdown(
+        "AUC (linear-up / log-down), Cmax, Tmax, λz and t½ from measured concentration-time profiles.")
+
+    col1, col2, col3 = st.columns(3)
+    nca_dose = col1.number_input("Dose (mg)", min_value=0.0, value=100.0,
+                                 key="nca_dose", persist_state="page")
+    nca_route = col2.selectbox("Route", ["Oral", "IV"], help="Used where the samples have no 'route' column",
+                               key="nca_route", persist_state="page")
+    nca_unit = col3.selectbox("Concentration Unit", ["mg/L", "µg/mL", "ng/mL"],
+                              key="nca_unit", persist_state="page")
+
+    nca_input = st.radio("Profiles", ["Paste one profile", "Upload a study (CSV / Excel)"],
+                         horizontal=True, key="nca_input", persist_state="page")
+    try:
+        if nca_input == "Paste one profile":
+            nca_text = st.text_area("Samples (one 'time in hours, concentration' pair per line)",
+                                    value="0, 0\n0.5, 3.1\n1, 4.6\n2, 4.2\n4, 3.0\n8, 1.5\n12, 0.8\n24, 0.12",
+                                    height=200, key="nca_text", persist_state="page")
+            table = parse_sample_text(nca_text)
+        else:
+            st.write("One row per sample with the columns `subject`, `time`, `conc` and optionally "
+                     "`route` (IV / Oral) and `dose`.")
+            upload = st.file_uploader("Study file", type=["csv", "xlsx", "xls"], key="nca_file")
+            if upload is None:
+                return
+            table = read_uploaded_table(upload)
+        results = pk_nca.nca(samples_in_mg_per_l(table, nca_unit), nca_dose, nca_route) \
+            if len(table) else pd.DataFrame()
+    except Exception as e:
+        st.error(f"Could not analyse the profiles: {e}")
+        return
+
+    if results.empty:
+        st.info("Enter at least one sample.")
+        return
+    st.caption(f"{len(results)} profiles. Concentrations in mg/L, AUC in mg·h/L; "
+               "CL is CL/F for extravascular doses.")
+    st.dataframe(results, hide_index=True, use_container_width=True)
+    if nca_input != "Paste one profile":
+        download_results(results, "nca", "nca")
+
+    bioavailability = pk_nca.nca_bioavailability(results)
+    if not bioavailability.empty:
+        st.markdown(f"**Absolute bioavailability (F):** geometric mean "
+                    f"{np.exp(np.log(bioavailability['F']).mean()):.3f} over {len(bioavailability)} subjects")
+        st.dataframe(bioavailability, hide_index=True, use_container_width=True)
+
+    # Hand one profile's AUC0-inf to the Clearance / Bioavailability calculators
+    labels = results["Subject"] + " – " + results["Route"]
+    chosen = st.selectbox("Profile", range(len(results)), format_func=lambda i: labels[i],
+                          key="nca_profile")
+    profile = results.iloc[chosen]
+    usable = pd.notna(profile["AUC0-inf"]) and pd.notna(profile["Dose (mg)"])
+    if not usable:
+        st.caption("This profile has no AUC0-inf (no terminal slope) or no dose.")
+
+    send_col1, send_col2 = st.columns(2)
+    if send_col1.button("Use in Clearance Calculator", use_container_width=True, disabled=not usable,
+                        key="nca_to_cl", on_click=send_to_calculator, args=("Clearance (CL)", {
+                            "cl_dose": float(profile["Dose (mg)"]), "cl_dose_unit": "mg", "cl_f": 1.0,
+                            "cl_auc": float(profile["AUC0-inf"]), "cl_auc_unit": "mg·h/L"})):
+        st.rerun()
+
+    # Bioavailability needs this subject's IV and extravascular profiles
+    subject = results[results["Subject"] == profile["Subject"]]
+    is_iv = subject["Route"].str.lower().isin(pk_nca.IV_ROUTES)
+    crossover = is_iv.any() and (~is_iv).any() and subject[["AUC0-inf", "Dose (mg)"]].notna().all().all()
+    if crossover:
+        iv, oral = subject[is_iv].iloc[0], subject[~is_iv].iloc[0]
+        bio_values = {"bio_auc_oral": float(oral["AUC0-inf"]), "bio_dose_oral": float(oral["Dose (mg)"]),
+                      "bio_auc_iv": float(iv["AUC0-inf"]), "bio_dose_iv": float(iv["Dose (mg)"])}
+    else:
+        bio_values = {}
+    if send_col2.button("Use in Bioavailability Calculator", use_container_width=True, disabled=not crossover,
+                        help="Needs an IV and an extravascular profile of the same subject",
+                        key="nca_to_bio", on_click=send_to_calculator, args=("Bioavailability (F)", bio_values)):
+        st.rerun()
+
+
+# --- CALCULATOR 10: POLYPHARMACY REGIMENS ---
+
+POLY_MAX_DRUGS = 20
+POLY_CHART_ROWS = 4000  # Points sent for all curves together (Altair refuses more than 5000 inline rows)
+
+def polypharmacy_params(indices, model, options, weight):
+    # Model parameters per mg of dose (ng/mL) for the chosen drugs: C0 = F / Vd where the table
+    # has a volume of distribution, else the curve is scaled to the reported Cmax at the reported
+    # dosage. Drugs without a half-life, or with neither, come back as NaN.
+    _, k, _, tmax, _ = batch_pk_parameters(df, numeric_df, indices)
+    cmax = numeric_values(numeric_df, indices, find_column(df.columns, "cmax", "Cmax"))
+    reported_dose = numeric_values(numeric_df, indices, find_column(df.columns, "dos", "Dosage"))
+    defaults = [drug_regimen_defaults(idx) for idx in indices]
+    vd = np.array([(d["vd"] or np.nan) * (weight if d["vd_per_kg"] else 1.0) for d in defaults])
+    f = np.array([d["f"] or 1.0 for d in defaults]) if "ka" in PK_MODELS[model]["params"] else 1.0
+
+    from_vd = vd > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(from_vd, float(convert(1.0, "mg/L", "ng/mL")) * f / vd, cmax / reported_dose)
+    return drug_model_params(model, scale, k, tmax=tmax, ka=options["ka"], tlag=options["tlag"],
+                             alpha_ratio=options["alpha_ratio"], frac_alpha=options["frac_alpha"],
+                             is_peak=~from_vd)
+
+
+@st.fragment
+@profiled_fragment
+def polypharmacy_tab():
+    st.subheader("Polypharmacy Regimen Simulator")
+    st.markdown(
+        "Superimpose the concentration-time profiles of several drugs taken together, each with its "
+        "own dose, dosing interval and start time.")
+
+    poly_drugs = st.multiselect("Drugs", list(drug_labels.index), max_selections=POLY_MAX_DRUGS,
+                                key="poly_drugs", persist_state="page")
+    poly_model = st.selectbox("PK Model", list(PK_MODELS), key="poly_model", persist_state="page")
+    poly_options = model_option_inputs(poly_model, "poly", default_ka=0.0)
+
+    col1, col2, col3 = st.columns(3)
+    poly_days = col1.number_input("Duration (days)", min_value=1, max_value=365, value=14, step=1,
+                                  key="poly_days", persist_state="page")
+    poly_resolution = col2.number_input("Points per Hour", min_value=1, max_value=60, value=12, step=1,
+                                        key="poly_resolution", persist_state="page")
+    poly_weight = col3.number_input("Body Weight (kg)", min_value=1.0, value=70.0, help="For Vd given in L/kg",
+                                    key="poly_weight", persist_state="page")
+
+    if not poly_drugs:
+        st.info("Pick the drugs the patient takes.")
+        return
+
+    # One row of regimen inputs per drug; keys include the drug so edits follow it when others are removed
+    indices = drug_labels[poly_drugs].to_numpy()
+    reported_dose = numeric_values(numeric_df, indices, find_column(df.columns, "dos", "Dosage"))
+    doses, intervals, starts = [], [], []
+    for label, idx, dose in zip(poly_drugs, indices, reported_dose):
         col1, col2, col3 = st.columns(3)
-        with col1:
-            measured_conc = st.number_input(
-                "Measured Concentration", min_value=0.0, value=25.0, key="tw_measured")
-        with col2:
-            min_therapeutic = st.number_input(
-                "Min Therapeutic Level", min_value=0.0, value=10.0, key="tw_min")
-        with col3:
-            max_therapeutic = st.number_input(
-                "Max Therapeutic Level", min_value=0.0, value=30.0, key="tw_max")
-
-        st.markdown("<br>", unsafe_allow_html=True)
-        if st.button("Check Status", use_container_width=True, key="tw_check_btn"):
-            if measured_conc < min_therapeutic:
-                st.warning(
-                    f"⚠️ **Sub-therapeutic**: {measured_conc} is below the effective range ({min_therapeutic}-{max_therapeutic}).")
-            elif measured_conc > max_therapeutic:
-                st.error(
-                    f"🚨 **Toxic**: {measured_conc} is above the safe range ({min_therapeutic}-{max_therapeutic}).")
-            else:
-                st.success(
-                    f"✅ **Therapeutic**: {measured_conc} is within the target range ({min_therapeutic}-{max_therapeutic}).")
+        doses.append(col1.number_input(f"{label}: Dose (mg)", min_value=0.0,
+                                       value=float(dose) if dose > 0 else 100.0,
+                                       key=f"poly_dose_{idx}", persist_state="page"))
+        intervals.append(col2.number_input("Interval (h)", min_value=0.5, value=24.0, step=1.0,
+                                           key=f"poly_interval_{idx}", persist_state="page"))
+        starts.append(col3.number_input("First Dose at (h)", min_value=0.0, value=0.0, step=1.0,
+                                        key=f"poly_start_{idx}", persist_state="page"))
+
+    params = polypharmacy_params(indices, poly_model, poly_options, poly_weight)
+    valid = np.isfinite(params["c0"]) & (params["c0"] > 0) & np.isfinite(params["k"]) & (params["k"] > 0)
+    skipped = [label for label, ok in zip(poly_drugs, valid) if not ok]
+    if skipped:
+        st.warning(f"Skipped (missing Half-Life, or both Vd and Cmax/Dosage): {', '.join(skipped)}")
+    if not valid.any():
+        return
+
+    labels = [label for label, ok in zip(poly_drugs, valid) if ok]
+    params = {name: value[valid] if np.ndim(value) else value for name, value in params.items()}
+    doses, intervals, starts = (np.asarray(v, dtype="float64")[valid] for v in (doses, intervals, starts))
+    end_time = float(poly_days) * 24
+
+    summary = regimen_steady_state(poly_model, params, doses, intervals, starts)
+    summary.insert(0, "Drug", labels)
+    summary.insert(1, "Regimen", [f"{d:g} mg every {t:g} h from {s:g} h"
+                                  for d, t, s in zip(doses, intervals, starts)])
+    summary["Steady State Day"] = np.ceil(summary["Steady State at (h)"] / 24)
+    st.caption(f"Concentrations in ng/mL. Steady state is reached at the first trough within "
+               f"{SS_FRACTION:.0%} of Cmin,ss.")
+    st.dataframe(summary, hide_index=True, use_container_width=True)
+    late = summary["Drug"][summary["Steady State at (h)"] > end_time]
+    if len(late):
+        st.caption(f"Not yet at steady state within {int(poly_days)} days: {', '.join(late)}")
+
+    poly_normalize = st.checkbox("Scale each drug to its Cmax,ss (%)", value=False,
+                                 key="poly_normalize", persist_state="page")
+
+    def build_poly_chart():
+        # All drugs on one shared grid in one evaluation, then each curve thinned for the browser
+        time_points = regimen_time_grid(poly_model, params, intervals, starts, end_time, poly_resolution)
+        matrix = regimen_concentrations(poly_model, params, doses, intervals, starts, time_points)
+        y_title = "Concentration (ng/mL)"
+        if poly_normalize:
+            matrix = 100 * matrix / summary["Cmax,ss"].to_numpy()[:, None]
+            y_title = "% of Cmax,ss"
+        timeline = curves_to_long(labels, time_points, matrix,
+                                  max_points=min(CHART_MAX_POINTS, POLY_CHART_ROWS // len(labels)))
+        timeline = timeline.rename(columns={"Concentration (ng/mL)": y_title})
+        return alt.Chart(timeline).mark_line(strokeWidth=2).encode(
+            x='Time (hours)',
+            y=y_title,
+            color=alt.Color('Drug:N', legend=alt.Legend(labelColor='#FFFFFF', titleColor='#FFFFFF')),
+            tooltip=['Drug', 'Time (hours)', y_title]
+        ).properties(background='#003366', height=450).configure_axis(
+            labelColor='#FFFFFF', titleColor='#FFFFFF', gridColor='#406080'
+        ).configure_view(stroke=None)
+
+    chart_key = ("polypharmacy", dataset_source, numeric_signature, poly_model, tuple(poly_options.items()),
+                 tuple(labels), tuple(doses), tuple(intervals), tuple(starts), poly_weight,
+                 int(poly_days), int(poly_resolution), poly_normalize)
+    show_chart(cached_chart_spec(chart_key, build_poly_chart))
+
+
+CALCULATOR_TABS = {
+    "Bioavailability (F)": bioavailability_tab,
+    "Cmin (Trough)": trough_tab,
+    "Clearance (CL)": clearance_tab,
+    "Half-Life / ke": half_life_tab,
+    "Steady State": steady_state_tab,
+    "Therapeutic Window": therapeutic_window_tab,
+    "Regimen Finder": regimen_finder_tab,
+    "Fit Levels": fit_levels_tab,
+    "NCA": nca_tab,
+    "Polypharmacy": polypharmacy_tab,
+}
+
+
+@st.fragment
+@profiled_fragment
+def pk_calculator_view():
+    st.header("Pharmacokinetic Calculator")
+    st.markdown(
+        "Estimate missing parameters using standard one-compartment models.")
+
+    # Create tabs for different calculators; switching tabs reruns only this view
+    tabs = st.tabs(list(CALCULATOR_TABS), key="calc_tab", on_change="rerun")
+    for tab, render_tab in zip(tabs, CALCULATOR_TABS.values()):
+        if tab.open:
+            with tab:
+                render_tab()
+
 
 # --- VIEW 5: PK GRAPH ---
-elif view_option == "PK Graph":
+
+@st.fragment
+@profiled_fragment
+def population_variability(idx, graph_model, graph_options, g_time, use_auc):
+    # Own fragment: changing the simulation settings reruns only this section
+    cmax_col = find_column(df.columns, "cmax", "Cmax")
+    half_life_col = find_column(df.columns, "half", "Half-Life")
+    auc_col = find_column(
+        df.columns, "auc", "Area Under the Curve (AUC) [ng.hr/mL]")
+    val_cmax = lookup_numeric(idx, cmax_col)
+    val_thalf = lookup_numeric(idx, half_life_col)
+    val_auc = lookup_numeric(idx, auc_col)
+    val_tmax = lookup_numeric(idx, find_column(df.columns, "tmax", "Tmax"))
+
+    st.markdown("---")
+    st.subheader("Population Variability")
+    st.write("Simulate virtual patients from the reported mean ± SD (log-normal) of Cmax, Half-Life and AUC, "
+             "and show the median with the 5th-95th percentile band.")
+
+    pop_col1, pop_col2, pop_col3 = st.columns(3)
+    with pop_col1:
+        pop_enabled = st.checkbox(
+            "Run population simulation", value=False, key="pop_enabled")
+    with pop_col2:
+        pop_n = st.number_input("Virtual Patients", min_value=100, max_value=100000, value=1000,
+                                step=100, key="pop_n")
+    with pop_col3:
+        pop_seed = st.number_input(
+            "Random Seed", min_value=0, value=42, step=1, key="pop_seed")
+
+    if pop_enabled:
+        pop_sds = {
+            "Cmax": lookup_numeric(idx, cmax_col, "sd"),
+            "Half-Life": lookup_numeric(idx, half_life_col, "sd"),
+            "AUC": lookup_numeric(idx, auc_col, "sd"),
+        }
+        pop_bands = simulate_population(
+            graph_model, val_cmax, pop_sds["Cmax"], val_thalf, pop_sds["Half-Life"],
+            val_auc if use_auc else None, pop_sds["AUC"],
+            val_tmax if val_tmax else np.nan, graph_options,
+            int(pop_n), int(pop_seed), float(g_time))
+
+        band = alt.Chart(pop_bands).mark_area(color="#6699CC", opacity=0.5).encode(
+            x='Time (hours)',
+            y=alt.Y('P5', title='Concentration (ng/mL)'),
+            y2='P95',
+            tooltip=['Time (hours)', 'P5', 'Median', 'P95']
+        )
+        median_line = alt.Chart(pop_bands).mark_line(color="#FFFFFF", strokeWidth=3).encode(
+            x='Time (hours)',
+            y='Median'
+        )
+        pop_chart = (band + median_line).properties(
+            background='#003366',
+            height=400
+        ).configure_axis(
+            labelColor='#FFFFFF',
+            titleColor='#FFFFFF',
+            gridColor='#406080',
+            labelFontSize=12,
+            titleFontSize=14,
+            grid=True
+        ).configure_view(
+            stroke=None
+        )
+        st.altair_chart(pop_chart, use_container_width=True)
+
+        varied = [name for name, sd in pop_sds.items() if sd]
+        st.caption(f"{int(pop_n)} virtual patients. Varied: {', '.join(varied) if varied else 'none'} "
+                   "(parameters without a reported SD are held at their mean).")
+
+
+@st.fragment
+@profiled_fragment
+def compare_drugs(drug_choices, graph_model, graph_options, g_time, use_auc):
+    # Own fragment: picking drugs / classes to compare reruns only this section
+    st.markdown("---")
+    st.subheader("Compare Drugs")
+    st.write("Overlay concentration curves for several drugs or whole therapeutic classes. Uses the Cmax source, time duration and model selected above.")
+
+    cmp_col1, cmp_col2 = st.columns(2)
+    with cmp_col1:
+        compare_labels = st.multiselect(
+            "Drugs to Compare:", list(drug_choices.index), key="cmp_drugs")
+    with cmp_col2:
+        compare_classes = st.multiselect(
+            "Add Whole Classes:", sorted(df['Class'].astype(str).unique()) if not df.empty else [], key="cmp_classes")
+    compare_log = st.checkbox(
+        "Logarithmic concentration axis", value=False, key="cmp_log")
+
+    # Selected drugs plus every (search-filtered) drug in the selected classes
+    compare_set = dict.fromkeys(compare_labels)
+    if compare_classes:
+        in_classes = df['Class'].loc[drug_choices.to_numpy()].astype(
+            str).isin(compare_classes).to_numpy()
+        compare_set.update(dict.fromkeys(drug_choices.index[in_classes]))
+    compare_labels = list(compare_set)
+
+    if compare_labels:
+        compare_indices = drug_choices[compare_labels].to_numpy()
+        c0s, ks, _, tmaxs, from_auc = batch_pk_parameters(
+            df, numeric_df, compare_indices, use_auc=use_auc)
+
+        valid = (c0s > 0) & (ks > 0)
+        skipped = [label for label, ok in zip(compare_labels, valid) if not ok]
+        plot_labels = [label for label, ok in zip(compare_labels, valid) if ok]
+
+        if plot_labels:
+            compare_params = drug_model_params(
+                graph_model, c0s[valid], ks[valid], tmax=tmaxs[valid],
+                ka=graph_options["ka"], tlag=graph_options["tlag"],
+                alpha_ratio=graph_options["alpha_ratio"], frac_alpha=graph_options["frac_alpha"],
+                is_peak=~from_auc[valid])
+            # One shared grid refined where any curve bends, then each curve thinned for the browser
+            time_points, matrix = adaptive_time_points(
+                graph_model, compare_params, g_time)
+            compare_data = curves_to_long(
+                plot_labels, time_points, matrix, max_points=CHART_MAX_POINTS)
+
+            y_scale = alt.Scale(type="log") if compare_log else alt.Scale()
+            if compare_log:
+                # Log axis cannot show zero concentrations
+                compare_data = compare_data[compare_data["Concentration (ng/mL)"] > 0]
+
+            compare_chart = alt.Chart(compare_data).mark_line(strokeWidth=2).encode(
+                x='Time (hours)',
+                y=alt.Y('Concentration (ng/mL)', scale=y_scale),
+                color=alt.Color('Drug:N', legend=alt.Legend(
+                    labelColor='#FFFFFF', titleColor='#FFFFFF')),
+                tooltip=['Drug', 'Time (hours)', 'Concentration (ng/mL)']
+            ).properties(
+                background='#003366',
+                height=500
+            ).configure_axis(
+                labelColor='#FFFFFF',
+                titleColor='#FFFFFF',
+                gridColor='#406080',
+                labelFontSize=12,
+                titleFontSize=14,
+                grid=True
+            ).configure_view(
+                stroke=None
+            )
+
+            st.altair_chart(compare_chart, use_container_width=True)
+            st.caption(f"Comparing {len(plot_labels)} drugs.")
+
+        if skipped:
+            st.warning(
+                f"Skipped (missing Half-Life or Cmax/AUC): {', '.join(skipped)}")
+
+
+@st.fragment
+@profiled_fragment
+def pk_graph_view():
     st.header("Concentration-Time Graph")
 
     col1, col2 = st.columns([1, 2])
@@ -669,70 +1589,50 @@ elif view_option == "PK Graph":
     with col1:
         st.subheader("Select Drug")
 
-        # Create a dictionary to map custom labels (Name + Dose) to dataframe indices
-        drug_choices = {}
-
-        # Identify if there is a specific dose column
-        dose_cols = [c for c in df.columns if any(
-            k in c.lower() for k in ['dose', 'strength', 'mg'])]
-        primary_dose_col = dose_cols[0] if dose_cols else None
-
-        for index, row in df.iterrows():
-            label = str(row['Name'])
-
-            # Append dose if available
-            if primary_dose_col and pd.notna(row[primary_dose_col]):
-                label = f"{label} - {row[primary_dose_col]}"
-
-            # Handle potential duplicates by appending count
-            original_label = label
-            count = 1
-            while label in drug_choices:
-                count += 1
-                label = f"{original_label} ({count})"
-
-            # Apply search filter if active
-            if search_term:
-                s_term = search_term.lower()
-                # Check Name, Class, or the constructed Label
-                if (s_term in str(row['Name']).lower() or
-                    s_term in str(row['Class']).lower() or
-                        s_term in label.lower()):
-                    drug_choices[label] = index
-            else:
-                drug_choices[label] = index
+        # Map custom labels (Name + Dose) to dataframe indices, ranked by the search if active
+        drug_choices = drug_labels
+        if search_term:
+            drug_choices = drug_choices.iloc[search_positions]
 
-        if not drug_choices:
+        if drug_choices.empty:
             st.warning("No drugs found matching criteria.")
             selected_graph_drug_label = None
         else:
             selected_graph_drug_label = st.selectbox(
-                "Choose a Drug to Plot:", list(drug_choices.keys()))
+                "Choose a Drug to Plot:", list(drug_choices.index))
 
         # Plotting Mode Selection
         st.markdown("---")
         plot_source = st.radio("Source for Peak Concentration ($C_{max}$):",
                                ["Use Reported $C_{max}$", "Calculate from AUC ($C_0 = AUC \cdot k$)"])
 
-        g_time = st.slider("Time Duration to Plot (hours)", 6, 72, 24)
+        g_time = st.slider("Time Duration to Plot (hours)", 6, 720, 24)
+
+        graph_model = st.selectbox(
+            "PK Model:", list(PK_MODELS), key="graph_model")
+        if len(PK_MODELS[graph_model]["params"]) > 2:
+            with st.expander("Model Parameters", expanded=False):
+                graph_options = model_option_inputs(
+                    graph_model, "graph", default_ka=0.0)
+        else:
+            graph_options = model_option_inputs(graph_model, "graph")
 
         # --- DATA EXTRACTION & PREPARATION (Happens in col1 for Calculator) ---
 
         if selected_graph_drug_label:
             idx = drug_choices[selected_graph_drug_label]
-            drug_row = df.loc[idx]
 
-            # Extract numerical values
-            cmax_col = [c for c in df.columns if "cmax" in c.lower()][0] if [
-                c for c in df.columns if "cmax" in c.lower()] else "Cmax"
-            half_life_col = [c for c in df.columns if "half" in c.lower(
-            )][0] if [c for c in df.columns if "half" in c.lower()] else "Half-Life"
-            auc_col = [c for c in df.columns if "auc" in c.lower()][0] if [
-                c for c in df.columns if "auc" in c.lower()] else "Area Under the Curve (AUC) [ng.hr/mL]"
+            # Read pre-parsed numerical values
+            cmax_col = find_column(df.columns, "cmax", "Cmax")
+            half_life_col = find_column(df.columns, "half", "Half-Life")
+            auc_col = find_column(
+                df.columns, "auc", "Area Under the Curve (AUC) [ng.hr/mL]")
 
-            val_cmax = extract_numeric(drug_row.get(cmax_col, None))
-            val_thalf = extract_numeric(drug_row.get(half_life_col, None))
-            val_auc = extract_numeric(drug_row.get(auc_col, None))
+            val_cmax = lookup_numeric(idx, cmax_col)
+            val_thalf = lookup_numeric(idx, half_life_col)
+            val_auc = lookup_numeric(idx, auc_col)
+            val_tmax = lookup_numeric(
+                idx, find_column(df.columns, "tmax", "Tmax"))
 
             if val_thalf and val_thalf > 0:
                 # Calculate k
@@ -752,6 +1652,19 @@ elif view_option == "PK Graph":
 
                 # --- QUICK CALCULATOR ---
                 if used_cmax and used_cmax > 0:
+                    graph_params = drug_model_params(
+                        graph_model, used_cmax, k,
+                        tmax=val_tmax if val_tmax else np.nan,
+                        ka=graph_options["ka"], tlag=graph_options["tlag"],
+                        alpha_ratio=graph_options["alpha_ratio"], frac_alpha=graph_options["frac_alpha"],
+                        is_peak=cmax_origin_text == "Reported")
+
+                    # Long enough for any target down to 1e-6 of the peak
+                    graph_horizon = graph_options["tlag"] + \
+                        10 / float(graph_params.get("ka", [np.inf])[0]) + 20 / k
+                    graph_peak = float(model_concentration(
+                        graph_model, graph_params, np.linspace(0, graph_horizon, 4001)).max())
+
                     st.markdown("---")
                     with st.expander("Quick Point Calculator", expanded=False):  # Emoji removed
                         calc_tab1, calc_tab2 = st.tabs(
@@ -761,7 +1674,8 @@ elif view_option == "PK Graph":
                             # Input: Time -> Output: Conc
                             in_time = st.number_input(
                                 "Time (h)", min_value=0.0, value=val_thalf, step=1.0, key="calc_t")
-                            out_conc = used_cmax * np.exp(-k * in_time)
+                            out_conc = float(model_concentration(
+                                graph_model, graph_params, [in_time])[0, 0])
                             st.markdown(f"**Conc:** `{out_conc:.2f} ng/mL`")
                             calc_point = pd.DataFrame(
                                 {'Time (hours)': [in_time], 'Concentration (ng/mL)': [out_conc]})
@@ -770,17 +1684,22 @@ elif view_option == "PK Graph":
                             # Input: Conc -> Output: Time
                             in_conc = st.number_input(
                                 "Target Conc (ng/mL)", min_value=0.0, value=used_cmax/2, step=1.0, key="calc_c")
-                            if in_conc >= used_cmax:
+                            if in_conc >= graph_peak:
                                 st.error(
-                                    f"Target must be < Peak ({used_cmax:.2f})")
+                                    f"Target must be < Peak ({graph_peak:.2f})")
                             elif in_conc <= 0:
                                 st.error("Target must be > 0")
                             else:
-                                out_time = -(1/k) * np.log(in_conc / used_cmax)
-                                st.markdown(
-                                    f"**Time:** `{out_time:.2f} hours`")
-                                calc_point = pd.DataFrame(
-                                    {'Time (hours)': [out_time], 'Concentration (ng/mL)': [in_conc]})
+                                out_time = time_to_concentration(
+                                    graph_model, graph_params, in_conc, graph_horizon)
+                                if out_time is None:
+                                    st.error(
+                                        f"Target is not reached within {graph_horizon:.0f} hours")
+                                else:
+                                    st.markdown(
+                                        f"**Time:** `{out_time:.2f} hours`")
+                                    calc_point = pd.DataFrame(
+                                        {'Time (hours)': [out_time], 'Concentration (ng/mL)': [in_conc]})
 
                         # Add limit of detection (LoD) input inside calculator
                         st.markdown("---")
@@ -792,62 +1711,74 @@ elif view_option == "PK Graph":
 
         if selected_graph_drug_label:
             if used_cmax and used_cmax > 0 and k:
-                # Generate data points
-                time_points = np.linspace(0, g_time, num=100)
-                concentrations = used_cmax * np.exp(-k * time_points)
-
-                # Create DataFrame for chart
-                chart_data = pd.DataFrame({
-                    "Time (hours)": time_points,
-                    "Concentration (ng/mL)": concentrations
-                })
-
-                # Base Line Chart
-                base_chart = alt.Chart(chart_data).mark_line(color="#FFFFFF", strokeWidth=3).encode(
-                    x='Time (hours)',
-                    y='Concentration (ng/mL)',
-                    tooltip=['Time (hours)', 'Concentration (ng/mL)']
-                )
-
-                final_chart = base_chart
-
-                # Add Point if calculator used
-                if calc_point is not None:
-                    point_chart = alt.Chart(calc_point).mark_circle(color="red", size=200, opacity=1).encode(
+                def build_elimination_chart():
+                    # Generate data points (dense where the curve bends, thinned for the browser)
+                    time_points, concentrations = adaptive_time_points(
+                        graph_model, graph_params, g_time)
+                    concentrations = concentrations[0]
+                    keep = lttb_indices(time_points, concentrations)
+
+                    # Create DataFrame for chart
+                    chart_data = pd.DataFrame({
+                        "Time (hours)": time_points[keep],
+                        "Concentration (ng/mL)": concentrations[keep]
+                    })
+
+                    # Base Line Chart
+                    base_chart = alt.Chart(chart_data).mark_line(color="#FFFFFF", strokeWidth=3).encode(
                         x='Time (hours)',
                         y='Concentration (ng/mL)',
                         tooltip=['Time (hours)', 'Concentration (ng/mL)']
                     )
-                    final_chart = final_chart + point_chart
 
-                # Add LoD Line if set
-                if lod > 0:
-                    lod_df = pd.DataFrame({'y': [lod]})
-                    lod_line = alt.Chart(lod_df).mark_rule(color='#FFA500', strokeDash=[5, 5], strokeWidth=2).encode(
-                        y='y'
+                    final_chart = base_chart
+
+                    # Add Point if calculator used
+                    if calc_point is not None:
+                        point_chart = alt.Chart(calc_point).mark_circle(color="red", size=200, opacity=1).encode(
+                            x='Time (hours)',
+                            y='Concentration (ng/mL)',
+                            tooltip=['Time (hours)', 'Concentration (ng/mL)']
+                        )
+                        final_chart = final_chart + point_chart
+
+                    # Add LoD Line if set
+                    if lod > 0:
+                        lod_df = pd.DataFrame({'y': [lod]})
+                        lod_line = alt.Chart(lod_df).mark_rule(color='#FFA500', strokeDash=[5, 5], strokeWidth=2).encode(
+                            y='y'
+                        )
+                        final_chart = final_chart + lod_line
+
+                    # Chart Properties
+                    final_chart = final_chart.properties(
+                        background='#003366',  # Dark Blue background
+                        height=400
+                    ).configure_axis(
+                        labelColor='#FFFFFF',
+                        titleColor='#FFFFFF',
+                        gridColor='#406080',  # Lighter blue grid for contrast
+                        labelFontSize=12,
+                        titleFontSize=14,
+                        grid=True
+                    ).configure_view(
+                        stroke=None
                     )
-                    final_chart = final_chart + lod_line
-
-                # Chart Properties
-                final_chart = final_chart.properties(
-                    background='#003366',  # Dark Blue background
-                    height=400
-                ).configure_axis(
-                    labelColor='#FFFFFF',
-                    titleColor='#FFFFFF',
-                    gridColor='#406080',  # Lighter blue grid for contrast
-                    labelFontSize=12,
-                    titleFontSize=14,
-                    grid=True
-                ).configure_view(
-                    stroke=None
-                )
-
-                st.altair_chart(final_chart, use_container_width=True)
+                    return final_chart
+
+                # Same drug, Cmax source, model, time range, LoD and calculator point -> same chart
+                chart_key = ("elimination", data_signature, idx, cmax_origin_text, used_cmax, val_thalf,
+                             g_time, lod, graph_model, tuple(sorted(graph_options.items())),
+                             None if calc_point is None else tuple(calc_point.iloc[0]))
+                show_chart(cached_chart_spec(
+                    chart_key, build_elimination_chart))
 
                 # Dynamic parameters display under graph
                 st.markdown(
-                    f"**Plotting Parameters:** Cmax ({cmax_origin_text}) = {used_cmax:.2f} ng/mL, Half-Life = {val_thalf}h")
+                    f"**Plotting Parameters:** Cmax ({cmax_origin_text}) = {used_cmax:.2f} ng/mL, Half-Life = {val_thalf:.4g}h, Model = {graph_model}")
+                cache_stats = chart_cache_stats()
+                st.caption(f"Chart cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                           f"{cache_stats['entries']} charts cached")
 
             elif not val_thalf:
                 st.error(
@@ -855,3 +1786,87 @@ elif view_option == "PK Graph":
             else:
                 st.error(
                     "Invalid or missing Cmax value (Reported or Calculated). Cannot plot.")
+
+    # --- POPULATION VARIABILITY ---
+    if selected_graph_drug_label and used_cmax and used_cmax > 0 and k:
+        population_variability(idx, graph_model, graph_options, g_time,
+                               use_auc=cmax_origin_text == "Calculated")
+
+    # --- MULTI-DRUG COMPARISON ---
+    compare_drugs(drug_choices, graph_model, graph_options, g_time,
+                  use_auc="Calculate from AUC" in plot_source)
+
+
+# --- DEVELOPER PANEL ---
+
+PROFILE_HISTORY = 20  # Fragment reruns kept per session for the panel
+
+
+def stage_table(record):
+    # Spans of a run in start order, nested stages indented
+    spans = sorted(record["spans"], key=lambda s: s["start_ms"])
+    return pd.DataFrame({
+        "Stage": ["\u2003" * s["depth"] + s["name"] for s in spans],
+        "Start (ms)": [round(s["start_ms"], 1) for s in spans],
+        "Time (ms)": [round(s["ms"], 1) for s in spans],
+    })
+
+
+def request_capture(mode):
+    # on_click: the rerun triggered by the button is profiled
+    st.session_state.profile_capture = mode
+
+
+def developer_panel(record):
+    with st.sidebar:
+        st.header("Developer")
+        st.metric("Full rerun", f"{record['total_ms']:.0f} ms")
+        st.dataframe(stage_table(record), hide_index=True, use_container_width=True)
+
+        runs = st.session_state.get("profile_runs")
+        if runs:
+            st.subheader("Fragment Reruns")
+            st.dataframe(pd.DataFrame({
+                "Fragment": [run["label"].removeprefix("fragment:") for run in reversed(runs)],
+                "Time (ms)": [round(run["total_ms"], 1) for run in reversed(runs)],
+            }), hide_index=True, use_container_width=True)
+
+        st.subheader("Caches")
+        stats = pk_profiling.cache_stats()
+        st.dataframe(pd.DataFrame({
+            "Cache": list(stats),
+            "Calls": [c["calls"] for c in stats.values()],
+            "Hits": [c["hits"] for c in stats.values()],
+            "Misses": [c["misses"] for c in stats.values()],
+            "Hit Rate": [c["hit_rate"] for c in stats.values()],
+        }), hide_index=True, use_container_width=True)
+        st.caption(f"Counted since the server started. Chart specs cached: {chart_cache_stats()['entries']}.")
+
+        # Built by the dataset watcher thread, outside any rerun
+        st.subheader("Dataset Version")
+        st.caption(", ".join(f"{step.replace('_', ' ')} {ms:.0f} ms" for step, ms in dataset["timings"].items()) +
+                   f" ({dataset['parsed_rows']} rows parsed)")
+
+        capture_mode = st.selectbox("Profiler", pk_profiling.CAPTURE_MODES, key="profile_capture_mode")
+        st.button("Profile Next Rerun", use_container_width=True, key="profile_capture_btn",
+                  on_click=request_capture, args=(capture_mode,))
+        if record.get("profile"):
+            with st.expander("Profile of this rerun", expanded=True):
+                st.code(record["profile"], language=None)
+
+
+# --- VIEW DISPATCH ---
+# Every view is a fragment: its widgets rerun only the view, while the CSS, header and
+# navigation above run again only on navigation or search.
+VIEWS = {
+    "Table View": table_view,
+    "Drugs by Class": drugs_by_class_view,
+    "Individual Drug View": individual_view,
+    "PK Calculator": pk_calculator_view,
+    "PK Graph": pk_graph_view,
+}
+
+VIEWS[view_option]()
+
+if PROFILING:
+    developer_panel(pk_profiling.end_run())
@@ -0,0 +1,166 @@
+# Vectorized pharmacokinetic calculator formulas (one-compartment models).
+# Every function accepts scalars or NumPy arrays / pandas columns and returns arrays,
+# so the calculator tabs and the bulk (CSV / Excel) mode share the exact same math.
+# Invalid inputs (e.g. zero doses or AUC) give NaN instead of raising.
+
+import numpy as np
+import pandas as pd
+
+KE_FACTOR = 0.693  # ln(2) as used in the displayed equations
+
+
+def _arrays(*values):
+    return [np.asarray(v, dtype="float64") for v in values]
+
+
+def bioavailability(auc_oral, dose_oral, auc_iv, dose_iv):
+    # F = (AUC_oral * Dose_iv) / (AUC_iv * Dose_oral)
+    auc_oral, dose_oral, auc_iv, dose_iv = _arrays(
+        auc_oral, dose_oral, auc_iv, dose_iv)
+    valid = (dose_oral > 0) & (auc_iv > 0) & (dose_iv > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(valid, (auc_oral * dose_iv) / (auc_iv * dose_oral), np.nan)
+
+
+def k_from_half_life(t_half):
+    # k = 0.693 / t½
+    (t_half,) = _arrays(t_half)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(t_half > 0, KE_FACTOR / t_half, np.nan)
+
+
+def half_life_from_k(k):
+    # t½ = 0.693 / k
+    (k,) = _arrays(k)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(k > 0, KE_FACTOR / k, np.nan)
+
+
+def trough_concentration(cmax, t_half, interval):
+    # Cmin = Cmax * e^(-k t); returns (k, Cmin)
+    cmax, interval = _arrays(cmax, interval)
+    k = k_from_half_life(t_half)
+    return k, cmax * np.exp(-k * interval)
+
+
+def clearance(dose, f, auc):
+    # CL = (F * Dose) / AUC
+    dose, f, auc = _arrays(dose, f, auc)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(auc > 0, (f * dose) / auc, np.nan)
+
+
+def steady_state(dose, interval, t_half, vd):
+    # One-compartment IV bolus at steady state; returns (Cmax_ss, Cmin_ss, Cavg_ss)
+    dose, interval, vd = _arrays(dose, interval, vd)
+    k = k_from_half_life(t_half)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c0 = np.where(vd > 0, dose / vd, np.nan)
+        cmax_ss = c0 / -np.expm1(-k * interval)
+        cmin_ss = cmax_ss * np.exp(-k * interval)
+        cavg_ss = c0 / (k * interval)
+    return cmax_ss, cmin_ss, cavg_ss
+
+
+def therapeutic_status(measured, min_level, max_level):
+    # "Sub-therapeutic" / "Therapeutic" / "Toxic" per measurement; "Invalid input" where the
+    # level or either limit is missing (blank / non-numeric cells in bulk mode)
+    measured, min_level, max_level = _arrays(measured, min_level, max_level)
+    missing = np.isnan(measured) | np.isnan(min_level) | np.isnan(max_level)
+    return np.select([missing, measured < min_level, measured > max_level],
+                     ["Invalid input", "Sub-therapeutic", "Toxic"], default="Therapeutic")
+
+
+# --- REGIMEN SEARCH ---
+
+STANDARD_INTERVALS = [4, 6, 8, 12, 24, 48, 72]  # Dosing intervals used in practice (hours)
+
+
+def max_interval_for_window(t_half, target_min, target_max):
+    # Longest τ whose steady-state swing fits the window: Cmax/Cmin = e^(kτ) -> τ = ln(max/min) / k
+    k = k_from_half_life(t_half)
+    target_min, target_max = _arrays(target_min, target_max)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where((target_min > 0) & (target_max > target_min),
+                        np.log(target_max / target_min) / k, np.nan)
+
+
+def rank_regimens(t_half, vd, target_min, target_max, doses, intervals, f=1.0):
+    # Steady state of every dose x interval pair in one broadcast (one-compartment IV bolus,
+    # absorbed dose F * Dose). Returns the regimens whose Cmin,ss and Cmax,ss both fall inside
+    # [target_min, target_max]: fewest doses per day first, then the ones furthest from both
+    # limits (margin = distance to the nearer limit as a fraction of the window width).
+    doses, intervals = _arrays(doses, intervals)
+    cmax_ss, cmin_ss, cavg_ss = steady_state(
+        f * doses[:, None], intervals[None, :], t_half, vd)
+
+    with np.errstate(invalid="ignore"):
+        feasible = (cmin_ss >= target_min) & (cmax_ss <= target_max)
+    rows, cols = np.nonzero(feasible)
+    width = target_max - target_min
+    regimens = pd.DataFrame({
+        "Dose (mg)": doses[rows],
+        "Interval (h)": intervals[cols],
+        "Doses per Day": 24 / intervals[cols],
+        "Daily Dose (mg)": doses[rows] * 24 / intervals[cols],
+        "Cmax,ss (mg/L)": cmax_ss[rows, cols],
+        "Cmin,ss (mg/L)": cmin_ss[rows, cols],
+        "Cavg,ss (mg/L)": cavg_ss[rows, cols],
+        "Margin": np.minimum(cmin_ss[rows, cols] - target_min,
+                             target_max - cmax_ss[rows, cols]) / width if width > 0 else 0.0,
+    })
+    return regimens.sort_values(["Doses per Day", "Margin"], ascending=[True, False],
+                                kind="stable", ignore_index=True)
+
+
+# --- BULK MODE ---
+# Input columns (matched case-insensitively) and output columns of each calculator tab.
+
+BULK_CALCULATORS = {
+    "Bioavailability (F)": {
+        "inputs": ["auc_oral", "dose_oral", "auc_iv", "dose_iv"],
+        "compute": lambda t: {"F": bioavailability(t["auc_oral"], t["dose_oral"], t["auc_iv"], t["dose_iv"])},
+    },
+    "Cmin (Trough)": {
+        "inputs": ["cmax", "t_half", "interval"],
+        "compute": lambda t: dict(zip(["k", "Cmin"], trough_concentration(t["cmax"], t["t_half"], t["interval"]))),
+    },
+    "Clearance (CL)": {
+        "inputs": ["dose", "f", "auc"],
+        "compute": lambda t: {"CL": clearance(t["dose"], t["f"], t["auc"])},
+    },
+    "Half-Life (t½)": {
+        "inputs": ["k"],
+        "compute": lambda t: {"t_half": half_life_from_k(t["k"])},
+    },
+    "Elimination Constant (k)": {
+        "inputs": ["t_half"],
+        "compute": lambda t: {"k": k_from_half_life(t["t_half"])},
+    },
+    "Steady State": {
+        "inputs": ["dose", "interval", "t_half", "vd"],
+        "compute": lambda t: dict(zip(["Cmax_ss", "Cmin_ss", "Cavg_ss"],
+                                      steady_state(t["dose"], t["interval"], t["t_half"], t["vd"]))),
+    },
+    "Therapeutic Window": {
+        "inputs": ["measured", "min_level", "max_level"],
+        "compute": lambda t: {"Status": therapeutic_status(t["measured"], t["min_level"], t["max_level"])},
+    },
+}
+
+
+def missing_bulk_columns(name, table):
+    present = {str(c).strip().lower() for c in table.columns}
+    return [c for c in BULK_CALCULATORS[name]["inputs"] if c not in present]
+
+
+def run_bulk(name, table):
+    # Append the calculator's output columns to a table of inputs (one row per case)
+    calc = BULK_CALCULATORS[name]
+    lookup = {str(c).strip().lower(): c for c in table.columns}
+    inputs = {c: pd.to_numeric(table[lookup[c]], errors="coerce").to_numpy(dtype="float64")
+              for c in calc["inputs"]}
+    result = table.copy()
+    for col, values in calc["compute"](inputs).items():
+        result[col] = values
+    return result
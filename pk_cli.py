@@ -0,0 +1,234 @@
+# Command line entry point: runs drug workbooks and case tables through the PK calculators
+# without starting the Streamlit app. Input is processed in row chunks and every chunk is
+# appended to the output as soon as it is computed, so large tables never sit in memory twice.
+#
+#   python pk_cli.py formulary drug_data.xlsx -o formulary.parquet --interval 12 --dose-interval 24
+#   python pk_cli.py formulary drug_data.xlsx -o patient.csv --weight 58 --age 81 --sex Female --scr 1.9
+#   python pk_cli.py bulk "Steady State" cases.csv -o results.csv --chunksize 50000
+#   python pk_cli.py fit levels.csv -o fits.csv --model "Two-Compartment IV Bolus" --dose 500
+#   python pk_cli.py nca study.csv -o nca.csv --dose 100 --route oral
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import pk_calc
+import pk_nca
+from pk_fit import FIT_MODELS, fit_sample_table
+from pk_covariates import DEFAULT_COVARIATES, HEPATIC_CLASSES, SEXES, adjust_numeric_table
+from pk_core import batch_pk_parameters, build_numeric_table, find_column, read_drug_table
+
+DEFAULT_CHUNKSIZE = 100_000
+
+
+# --- INPUT / OUTPUT ---
+
+def read_chunks(path, chunksize):
+    # CSV and Parquet are read incrementally; Excel workbooks have to be read whole
+    lower = path.lower()
+    if lower.endswith(".csv"):
+        yield from pd.read_csv(path, chunksize=chunksize)
+    elif lower.endswith(".parquet"):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    elif lower.endswith((".xlsx", ".xls")):
+        table = pd.read_excel(path)
+        for start in range(0, len(table), chunksize):
+            yield table.iloc[start:start + chunksize]
+    else:
+        raise ValueError(f"Unsupported input format: {path} (use .csv, .parquet or .xlsx)")
+
+
+def write_chunks(chunks, path):
+    # Append each DataFrame to one CSV or Parquet file (chosen by extension); returns rows written
+    rows = 0
+    if path.lower().endswith(".parquet"):
+        writer = None
+        try:
+            for chunk in chunks:
+                # Later chunks are cast to the first chunk's schema
+                table = pa.Table.from_pandas(chunk, preserve_index=False,
+                                             schema=writer.schema if writer else None)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    elif path.lower().endswith(".csv"):
+        for chunk in chunks:
+            chunk.to_csv(path, mode="a" if rows else "w",
+                         header=not rows, index=False)
+            rows += len(chunk)
+    else:
+        raise ValueError(f"Unsupported output format: {path} (use .csv or .parquet)")
+    return rows
+
+
+# --- FORMULARY ---
+
+def formulary_results(data, interval, dose_interval, use_auc=False, covariates=None):
+    # Parsed PK values plus derived quantities for each drug row of a cleaned workbook chunk,
+    # with Vd, CL, t½ and AUC scaled for one patient when covariates are given
+    numeric = build_numeric_table(data)
+    if covariates is not None:
+        numeric = adjust_numeric_table(data, numeric, covariates)
+    c0, k, t_half, tmax, from_auc = batch_pk_parameters(
+        data, numeric, data.index, use_auc=use_auc)
+
+    result = data[["Name", "Class"]].astype("string").reset_index(drop=True)
+    for col in numeric.columns.get_level_values(0).unique():
+        result[col] = numeric[(col, "value")].to_numpy()
+
+    result["k (1/h)"] = k
+    result["C0 (ng/mL)"] = c0
+    result["C0 From AUC"] = from_auc
+    _, result[f"Conc at {interval:g}h (ng/mL)"] = pk_calc.trough_concentration(
+        c0, t_half, interval)
+
+    # Steady state of a repeated dose needs the dose and volume of distribution columns
+    dose_col = find_column(data.columns, "dos", None)
+    vd_col = find_column(data.columns, "volume", None)
+    if dose_col is not None and vd_col is not None:
+        cmax_ss, cmin_ss, cavg_ss = pk_calc.steady_state(
+            result[dose_col], dose_interval, t_half, result[vd_col])
+        result["Cmax,ss (mg/L)"] = cmax_ss
+        result["Cmin,ss (mg/L)"] = cmin_ss
+        result["Cavg,ss (mg/L)"] = cavg_ss
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result["Accumulation Ratio"] = 1 / -np.expm1(-k * dose_interval)
+    return result
+
+
+def run_formulary(args):
+    sheet = int(args.sheet) if args.sheet.isdigit() else args.sheet
+    data = read_drug_table(args.workbook, sheet=sheet)
+    if 'Name' not in data.columns:
+        raise ValueError("The workbook must have a column labeled 'Name'.")
+
+    covariates = {name: getattr(args, name) for name in DEFAULT_COVARIATES}
+    if covariates == DEFAULT_COVARIATES:
+        covariates = None  # No patient given: population values
+    chunks = (formulary_results(data.iloc[start:start + args.chunksize], args.interval,
+                                args.dose_interval, use_auc=args.use_auc, covariates=covariates)
+              for start in range(0, len(data), args.chunksize))
+    return write_chunks(chunks, args.output)
+
+
+# --- BULK CALCULATORS ---
+
+def bulk_results(name, chunks):
+    for chunk in chunks:
+        missing = pk_calc.missing_bulk_columns(name, chunk)
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+        yield pk_calc.run_bulk(name, chunk)
+
+
+def run_bulk(args):
+    return write_chunks(bulk_results(args.calculator, read_chunks(args.input, args.chunksize)),
+                        args.output)
+
+
+# --- PARAMETER FITTING ---
+
+def run_fit(args):
+    # All patients are fitted in one batched call, so the sample table is read whole
+    table = pd.concat(read_chunks(args.input, args.chunksize), ignore_index=True)
+    fits = fit_sample_table(args.model, table, dose=args.dose)
+    fits = fits.drop(columns=[c for c in fits.columns if c.startswith("model_")])
+    return write_chunks([fits], args.output)
+
+
+def run_nca(args):
+    table = pd.concat(read_chunks(args.input, args.chunksize), ignore_index=True)
+    return write_chunks([pk_nca.nca(table, dose=args.dose, route=args.route)], args.output)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="pk_cli", description="Run drug tables through the CardioKinetics PK calculators.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    formulary = commands.add_parser(
+        "formulary", help="Parse a drug workbook and add derived PK quantities per drug")
+    formulary.add_argument("workbook", help="Excel workbook in the drug_data.xlsx layout")
+    formulary.add_argument("-o", "--output", required=True,
+                           help="Output file (.csv or .parquet)")
+    formulary.add_argument("--sheet", default="0",
+                           help="Sheet name or 0-based index (default: the first sheet)")
+    formulary.add_argument("--interval", type=float, default=24.0,
+                           help="Hours after C0 at which to report the concentration (default 24)")
+    formulary.add_argument("--dose-interval", type=float, default=24.0,
+                           help="Dosing interval (tau) for steady state, in hours (default 24)")
+    formulary.add_argument("--use-auc", action="store_true",
+                           help="Derive C0 from AUC * k where AUC is available")
+    formulary.add_argument("--weight", type=float, default=DEFAULT_COVARIATES["weight"],
+                           help="Patient weight in kg (scales Vd and CL)")
+    formulary.add_argument("--age", type=float, default=DEFAULT_COVARIATES["age"],
+                           help="Patient age for Cockcroft-Gault CrCl")
+    formulary.add_argument("--sex", choices=SEXES, default=DEFAULT_COVARIATES["sex"])
+    formulary.add_argument("--scr", type=float, default=DEFAULT_COVARIATES["scr"],
+                           help="Serum creatinine in mg/dL for Cockcroft-Gault CrCl")
+    formulary.add_argument("--hepatic", choices=list(HEPATIC_CLASSES), default=DEFAULT_COVARIATES["hepatic"])
+    formulary.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    formulary.set_defaults(run=run_formulary)
+
+    bulk = commands.add_parser(
+        "bulk", help="Run one calculator over a table with one row per case")
+    bulk.add_argument("calculator", choices=list(pk_calc.BULK_CALCULATORS))
+    bulk.add_argument("input", help="Input table (.csv, .parquet or .xlsx)")
+    bulk.add_argument("-o", "--output", required=True,
+                      help="Output file (.csv or .parquet)")
+    bulk.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    bulk.set_defaults(run=run_bulk)
+
+    fit = commands.add_parser(
+        "fit", help="Fit k, t½, Vd and CL per patient to measured concentrations")
+    fit.add_argument("input", help="Sample table (.csv, .parquet or .xlsx) with columns "
+                     "time, conc (mg/L) and optionally patient, dose (mg)")
+    fit.add_argument("-o", "--output", required=True,
+                     help="Output file (.csv or .parquet)")
+    fit.add_argument("--model", choices=list(FIT_MODELS), default="One-Compartment IV Bolus")
+    fit.add_argument("--dose", type=float, default=None,
+                     help="Dose in mg for patients without a dose column value")
+    fit.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    fit.set_defaults(run=run_fit)
+
+    nca = commands.add_parser(
+        "nca", help="Non-compartmental analysis (AUC, Cmax, Tmax, λz, t½, CL) per profile")
+    nca.add_argument("input", help="Sample table (.csv, .parquet or .xlsx) with columns "
+                     "time, conc (mg/L) and optionally subject, route, dose (mg)")
+    nca.add_argument("-o", "--output", required=True,
+                     help="Output file (.csv or .parquet)")
+    nca.add_argument("--dose", type=float, default=None,
+                     help="Dose in mg for profiles without a dose column value")
+    nca.add_argument("--route", default="oral",
+                     help="Route for profiles without a route column value: oral or iv (default oral)")
+    nca.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    nca.set_defaults(run=run_nca)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.chunksize < 1:
+        print("Error: --chunksize must be at least 1", file=sys.stderr)
+        return 2
+    try:
+        rows = args.run(args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Wrote {rows} rows to {os.path.abspath(args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
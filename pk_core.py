@@ -0,0 +1,465 @@
+# Drug table loading and numeric parsing, shared by the Streamlit app and the command line tool.
+# Nothing here imports streamlit: the app wraps these functions in st.cache_* and reports errors
+# with st.error, while pk_cli.py uses them directly.
+
+import hashlib
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+import pk_calc
+from pk_units import normalize_units
+
+DATA_FILE = "drug_data.xlsx"
+DATA_DIR = "."  # Every workbook here is offered as a dataset (see build_catalog)
+WORKBOOK_EXTENSIONS = (".xlsx", ".xls")
+MERGED_SOURCE = "All workbooks (merged)"
+CACHE_DIR = ".pk_cache"  # Columnar copies of the workbook (safe to delete)
+CACHE_FORMAT = 2  # Bump when the cleaning below changes, so old columnar copies are not reused
+
+# Header spellings used by other formularies, mapped onto this app's names (after clean_header)
+HEADER_ALIASES = {
+    "Drug": "Name",
+    "Drug Name": "Name",
+    "Generic Name": "Name",
+    "Drug Class": "Class",
+    "Therapeutic Class": "Class",
+}
+
+# Shown when the workbook is missing; uses the same naming conventions as clean_header
+MOCK_DATA = [
+    {
+        "Name": "Lisinopril",
+        "Class": "ACE Inhibitor",
+        "Half-Life": "12h",
+        "Cmax": "40 ng/mL",
+        "Area Under the Curve (AUC) [ng.hr/mL]": "500 ng·h/mL",
+        "Bioavailability": "25%",
+        "Clearance": "50 mL/min"
+    },
+    {
+        "Name": "Atorvastatin",
+        "Class": "Statin",
+        "Half-Life": "14h",
+        "Cmax": "20 ng/mL",
+        "Area Under the Curve (AUC) [ng.hr/mL]": "200 ng·h/mL",
+        "Bioavailability": "14%",
+        "Clearance": "N/A"
+    },
+    {
+        "Name": "Metoprolol",
+        "Class": "Beta Blocker",
+        "Half-Life": "3-7h",
+        "Cmax": "100 ng/mL",
+        "Area Under the Curve (AUC) [ng.hr/mL]": "1200 ng·h/mL",
+        "Bioavailability": "50%",
+        "Clearance": "1 L/min"
+    },
+]
+
+
+# --- DATA LOADING ---
+
+def source_signature(path, sheet=0):
+    # (path, size, mtime, sheet) identifies one version of a workbook sheet on disk
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, sheet)
+
+
+def columnar_cache_path(signature):
+    digest = hashlib.sha1(
+        repr((CACHE_FORMAT, signature)).encode()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(signature[0]))[0]
+    sheet = re.sub(r"[^\w.]+", "_", str(signature[3]))
+    return os.path.join(CACHE_DIR, f"{stem}-{sheet}-{digest}.feather")
+
+
+def read_columnar_cache(signature, shared=False):
+    # Memory-map the Feather copy written for this exact workbook version, if any. With shared=True
+    # the columns stay Arrow arrays backed by the mapped file (no copy), so every process that maps
+    # the same file shares its pages; the result must then be treated as read-only.
+    path = columnar_cache_path(signature)
+    if not os.path.exists(path):
+        return None
+    try:
+        table = feather.read_table(path, memory_map=True)
+        return table.to_pandas(types_mapper=pd.ArrowDtype) if shared else table.to_pandas()
+    except Exception:
+        return None  # Corrupt or unreadable cache file: rebuild from Excel
+
+
+def write_columnar_cache(data, signature):
+    path = columnar_cache_path(signature)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to a temp file and rename so other worker processes never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        data.reset_index(drop=True).to_feather(
+            tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+
+        # Remove copies of older versions of the same workbook
+        stem = os.path.basename(path).rsplit("-", 1)[0]
+        for name in os.listdir(CACHE_DIR):
+            old_path = os.path.join(CACHE_DIR, name)
+            if name.startswith(f"{stem}-") and name.endswith(".feather") and old_path != path:
+                os.remove(old_path)
+    except Exception:
+        pass  # The cache is only an optimization; never fail the load because of it
+
+
+def normalize_mixed_columns(data):
+    # Excel columns mixing numbers and text ("1090", "61 ± 13.42") are stored as text
+    # so they have a single Arrow type; missing cells stay missing. Text is stripped, which
+    # also drops the trailing non-breaking spaces some formulary exports add to drug names.
+    for c in data.columns:
+        if data[c].dtype == object or pd.api.types.is_string_dtype(data[c]):
+            data[c] = data[c].where(
+                data[c].isna(), data[c].astype(str).str.strip())
+    return data
+
+
+def clean_header(c):
+    # Clean and format headers scientifically
+    original = c.strip()
+
+    # 1. Rename AUC explicitly - Case Insensitive Check
+    if original.lower() == "auc":
+        return "Area Under the Curve (AUC) [ng.hr/mL]"
+
+    # 2. Fix Scientific Units (Title casing destroys units like mL, pH, etc.)
+    c_title = original.title()
+
+    # Restore specific unit capitalization
+    c_title = c_title.replace("Ng/Ml", "ng/mL")
+    c_title = c_title.replace("Ug/Ml", "µg/mL")
+    c_title = c_title.replace("Mg/L", "mg/L")
+    c_title = c_title.replace("Ng.Hr/Ml", "ng.hr/mL")
+    c_title = c_title.replace("Ng*H/Ml", "ng.hr/mL")
+    c_title = c_title.replace("Ml/Min", "mL/min")
+    c_title = c_title.replace("L/Min", "L/min")
+    c_title = c_title.replace("Iv", "IV")
+
+    # 3. Other formularies' names for the identifying columns
+    return HEADER_ALIASES.get(c_title, c_title)
+
+
+def read_drug_table(path, signature=None, shared=False, sheet=0):
+    # Workbook sheet -> cleaned drug table. Reuses the columnar copy when this version of the
+    # sheet was already converted (see read_columnar_cache for shared). Raises if the
+    # file cannot be read; callers check for the 'Name' column themselves.
+    if signature is None:
+        signature = source_signature(path, sheet)
+    data = read_columnar_cache(
+        signature, shared) if signature is not None else None
+
+    if data is None:
+        data = pd.read_excel(path, sheet_name=sheet)
+
+        # Apply the clean_header function to all columns
+        data.columns = [clean_header(c) for c in data.columns]
+        data = normalize_mixed_columns(data)
+        if signature is not None:
+            write_columnar_cache(data, signature)
+            if shared:
+                # Serve the memory-mapped copy just written (if writing it failed, keep this one)
+                mapped = read_columnar_cache(signature, shared)
+                if mapped is not None:
+                    data = mapped
+
+    if 'Name' in data.columns and 'Class' not in data.columns:
+        # If no class column, add a placeholder
+        data['Class'] = "Uncategorized"
+    return data
+
+
+def mock_drug_table():
+    return pd.DataFrame(MOCK_DATA)
+
+
+# --- DATASET CATALOG ---
+# Each sheet of each workbook in DATA_DIR is one source, plus a merged source when there are
+# several. A source is a dict: {"id", "path", "sheet"} or, merged, {"id", "parts": [sources]}.
+
+def list_workbooks(data_dir=DATA_DIR):
+    # Skips the "~$name.xlsx" lock files Excel leaves next to open workbooks
+    return sorted(os.path.join(data_dir, name) for name in os.listdir(data_dir)
+                  if name.lower().endswith(WORKBOOK_EXTENSIONS) and not name.startswith("~$"))
+
+
+def workbook_sources(path):
+    # One source per sheet; a single-sheet workbook is listed under its file name only
+    name = os.path.basename(path)
+    try:
+        with pd.ExcelFile(path) as book:
+            sheets = book.sheet_names
+    except Exception:
+        # Listed anyway, so the read error is reported when the source is opened
+        return [{"id": name, "path": path, "sheet": 0}]
+    if len(sheets) == 1:
+        return [{"id": name, "path": path, "sheet": sheets[0]}]
+    return [{"id": f"{name} › {sheet}", "path": path, "sheet": sheet} for sheet in sheets]
+
+
+def build_catalog(paths):
+    # {source id: source}; DATA_FILE keeps its place as the default even when it is missing
+    # (its source then falls back to the mock data)
+    catalog = {}
+    if not any(os.path.basename(p) == DATA_FILE for p in paths):
+        catalog[DATA_FILE] = {"id": DATA_FILE, "path": DATA_FILE, "sheet": 0}
+    for path in paths:
+        for source in workbook_sources(path):
+            catalog[source["id"]] = source
+    if len(catalog) > 1:
+        catalog[MERGED_SOURCE] = {"id": MERGED_SOURCE,
+                                  "parts": list(catalog.values())}
+    return catalog
+
+
+def catalog_signature(source):
+    # Version key of a source: its sheet's signature, or the tuple of its parts' signatures
+    if "parts" in source:
+        parts = tuple(catalog_signature(part) for part in source["parts"])
+        return parts if any(parts) else None
+    return source_signature(source["path"], source["sheet"])
+
+
+def read_source_table(source, signature=None, shared=False):
+    # Drug table of one source. A merged source stacks the tables of its parts that have a
+    # 'Name' column (columns are matched by their clean_header names) and records where each
+    # row came from in a 'Source' column.
+    if "parts" not in source:
+        return read_drug_table(source["path"], signature, shared, source["sheet"])
+
+    tables = []
+    for part in source["parts"]:
+        part_signature = catalog_signature(part)
+        if part_signature is None:
+            continue
+        table = read_drug_table(part["path"], part_signature, sheet=part["sheet"])
+        if 'Name' in table.columns:
+            tables.append(table.assign(Source=part["id"]))
+    if not tables:
+        return pd.DataFrame()
+    return normalize_mixed_columns(pd.concat(tables, ignore_index=True))
+
+
+# --- NUMERIC PARSING ---
+
+# Helper function to extract numeric values from strings (e.g., "12h" -> 12.0, "61 ± 13.42" -> 61.0)
+def extract_numeric(val_str):
+    if isinstance(val_str, (int, float)):
+        return float(val_str)
+
+    val_str = str(val_str)
+
+    # 1. Handle "±" specifically: Split by it and take the first part
+    if '±' in val_str:
+        val_str = val_str.split('±')[0]
+
+    # 2. Simple regex to find the first valid number (integer or float) in the remaining string
+    # This matches optional +/- sign, digits, optional dot, digits.
+    match = re.search(r"[-+]?\d*\.?\d+", val_str)
+    if match:
+        return float(match.group())
+
+    return None
+
+
+# Patterns used to parse whole PK columns at once (vectorized counterpart of extract_numeric)
+# e.g. "61 ± 13.42" -> value 61, sd 13.42 | "3-7h" -> value 3, low 3, high 7, unit "h"
+NUMERIC_VALUE_PATTERN = r"^[^±]*?([-+]?\d*\.?\d+)"
+NUMERIC_SD_PATTERN = r"±\s*(\d*\.?\d+)"
+NUMERIC_RANGE_PATTERN = r"(\d*\.?\d+)\s*[-–]\s*(\d*\.?\d+)"
+NUMERIC_UNIT_PATTERN = r"^[^±]*?\d\s*([%A-Za-zµμ][^\s±]*)"
+NUMERIC_FIELDS = ["value", "sd", "low", "high", "unit", "source_unit"]
+
+
+def parse_numeric_column(series):
+    # Cells that are already numbers (or pure number strings) need no regex work
+    direct = pd.to_numeric(series, errors="coerce").astype("float64")
+
+    # Drop thousands separators written as thin spaces (e.g. "10 800")
+    text = series.astype("string").str.replace(
+        r"(?<=\d)[\u2009\u202f](?=\d)", "", regex=True)
+
+    ranges = text.str.extract(NUMERIC_RANGE_PATTERN)
+
+    parsed = pd.DataFrame({
+        "value": direct.fillna(pd.to_numeric(text.str.extract(NUMERIC_VALUE_PATTERN)[0])),
+        "sd": pd.to_numeric(text.str.extract(NUMERIC_SD_PATTERN)[0]),
+        "low": pd.to_numeric(ranges[0]),
+        "high": pd.to_numeric(ranges[1]),
+        "unit": text.str.extract(NUMERIC_UNIT_PATTERN)[0].astype("category"),
+    }, index=series.index)
+    parsed[["value", "sd", "low", "high"]] = parsed[[
+        "value", "sd", "low", "high"]].astype("float64")
+    return parsed
+
+
+def build_numeric_table(data):
+    # One parsed block per PK column, addressed as numeric[(column, field)], with every value
+    # already in its column's canonical unit (see pk_units)
+    pk_cols = [c for c in data.columns if c not in ['Name', 'Class']]
+    if not pk_cols:
+        return pd.DataFrame(index=data.index, columns=pd.MultiIndex.from_product([[], NUMERIC_FIELDS]))
+    return pd.concat([normalize_units(parse_numeric_column(data[c]), c) for c in pk_cols],
+                     axis=1, keys=pk_cols)
+
+
+def unchanged_rows(old_data, new_data):
+    # Rows of new_data that are identical in old_data, matched on Name + dose (the drug label).
+    # Returns (mask over new_data, position of each new row in old_data or -1).
+    old_keys = pd.Index(build_drug_labels(old_data).index)
+    positions = old_keys.get_indexer(build_drug_labels(new_data).index)
+    matched = positions >= 0
+    if list(old_data.columns) != list(new_data.columns) or not matched.any():
+        return np.zeros(len(new_data), dtype=bool), positions
+
+    def cells(data):
+        # Missing cells compare equal whatever their representation (NaN, None, pd.NA)
+        values = data.astype(object)
+        return values.where(data.notna(), None).to_numpy()
+
+    old_cells = cells(old_data.iloc[np.where(matched, positions, 0)])
+    same = (old_cells == cells(new_data)).all(axis=1)
+    return matched & same, positions
+
+
+def update_numeric_table(old_data, old_numeric, new_data):
+    # Numeric table for a new version of the drug table that re-parses only new or edited rows.
+    # Returns (numeric table, number of rows parsed).
+    keep, positions = unchanged_rows(old_data, new_data)
+    if not keep.any():
+        return build_numeric_table(new_data), len(new_data)
+
+    reused = old_numeric.iloc[positions[keep]].set_axis(new_data.index[keep])
+    if keep.all():
+        return reused, 0
+
+    numeric = pd.concat([reused, build_numeric_table(new_data[~keep])]).reindex(new_data.index)
+    # Unit categories differ between the two parts; concatenating turned them into plain objects
+    units = [c for c in numeric.columns if c[1] in ("unit", "source_unit")]
+    numeric[units] = numeric[units].astype("category")
+    return numeric, int((~keep).sum())
+
+
+def find_column(columns, keyword, default):
+    # First column whose header contains the keyword (case insensitive)
+    matches = [c for c in columns if keyword in c.lower()]
+    return matches[0] if matches else default
+
+
+def batch_pk_parameters(data, numeric, indices, use_auc=False):
+    # Vectorized lookup of (C0, k, t½, Tmax, from_auc) for many rows of the numeric table at once.
+    # Mirrors the single-drug logic: C0 = AUC * k when requested and available, else reported Cmax.
+    cmax_col = find_column(data.columns, "cmax", "Cmax")
+    half_life_col = find_column(data.columns, "half", "Half-Life")
+    auc_col = find_column(
+        data.columns, "auc", "Area Under the Curve (AUC) [ng.hr/mL]")
+    tmax_col = find_column(data.columns, "tmax", "Tmax")
+
+    t_half = numeric_values(numeric, indices, half_life_col)
+    cmax = numeric_values(numeric, indices, cmax_col)
+    auc = numeric_values(numeric, indices, auc_col)
+
+    k = pk_calc.k_from_half_life(t_half)
+    from_auc = use_auc & (auc > 0)
+    c0 = np.where(from_auc, auc * k, cmax)
+    return c0, k, t_half, numeric_values(numeric, indices, tmax_col), from_auc
+
+
+def numeric_values(numeric, indices, col):
+    # Parsed values of one column for many rows (NaN when the column does not exist)
+    if (col, "value") not in numeric.columns:
+        return np.full(len(indices), np.nan)
+    return numeric.loc[indices, (col, "value")].to_numpy(dtype="float64")
+
+
+# --- CLASS ANALYTICS ---
+
+ACCUMULATION_INTERVALS = [8, 12, 24]  # Dosing intervals (h) for the accumulation ratio
+
+
+def class_partition(data):
+    # {class: row positions} for the whole table in one groupby (classes in order of appearance)
+    if 'Class' not in data.columns:
+        return {}
+    return data.groupby('Class', sort=False, dropna=False).indices
+
+
+def exposure_metrics(data, numeric, indices, intervals=ACCUMULATION_INTERVALS):
+    # Dose-normalized exposure and accumulation of many drugs in one pass (canonical units:
+    # AUC ng·h/mL, Cmax ng/mL, dose mg). The accumulation ratio of repeated dosing every τ is
+    # R = 1 / (1 - e^(-kτ)); the t½ spread is each drug's t½ relative to the group median.
+    _, k, t_half, _, _ = batch_pk_parameters(data, numeric, indices)
+    dose = numeric_values(numeric, indices, find_column(data.columns, "dos", None))
+    cmax = numeric_values(numeric, indices, find_column(data.columns, "cmax", "Cmax"))
+    auc = numeric_values(numeric, indices, find_column(
+        data.columns, "auc", "Area Under the Curve (AUC) [ng.hr/mL]"))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dose = np.where(dose > 0, dose, np.nan)
+        metrics = {
+            "AUC per mg (ng·h/mL)": auc / dose,
+            "Cmax per mg (ng/mL)": cmax / dose,
+            "t½ (h)": t_half,
+            "t½ vs Class Median": t_half / np.nanmedian(t_half) if np.isfinite(t_half).any() else t_half,
+        }
+        ratios = 1 / -np.expm1(-k[:, None] * np.asarray(intervals, dtype="float64")[None, :])
+    for i, tau in enumerate(intervals):
+        metrics[f"Accumulation (τ = {tau:g} h)"] = ratios[:, i]
+    return pd.DataFrame(metrics, index=indices)
+
+
+# --- TABLE PAGING ---
+
+def sort_ranks(data, numeric, column, descending=False):
+    # Rank of every row of the table when sorted by column: parsed numbers for PK columns, case
+    # insensitive text otherwise, missing values last either way. Any subset of row positions
+    # is then put in that order with positions[np.argsort(ranks[positions])].
+    if (column, "value") in numeric.columns:
+        keys = pd.Series(numeric[(column, "value")].to_numpy(dtype="float64"))
+    else:
+        keys = data[column].reset_index(drop=True).astype("string").str.lower()
+    order = keys.sort_values(ascending=not descending, na_position="last",
+                             kind="stable").index.to_numpy()
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order))
+    return ranks
+
+
+def page_bounds(n_rows, page, page_size):
+    # (start, stop, number of pages) of a 1-based page; out-of-range pages show the last one
+    pages = max(1, -(-n_rows // page_size))
+    page = min(max(page, 1), pages)
+    start = (page - 1) * page_size
+    return start, min(start + page_size, n_rows), pages
+
+
+# --- DRUG LABEL INDEX ---
+
+def build_drug_labels(data):
+    # "Name - Dose" label per row (with " (2)", " (3)"... for repeats) -> dataframe index
+    if data.empty:
+        return pd.Series(dtype=object)
+
+    # Identify if there is a specific dose column
+    dose_cols = [c for c in data.columns if any(
+        k in c.lower() for k in ['dose', 'strength', 'mg'])]
+    primary_dose_col = dose_cols[0] if dose_cols else None
+
+    labels = data['Name'].astype(str)
+    if primary_dose_col:
+        dose = data[primary_dose_col]
+        labels = labels.where(dose.isna(), labels + " - " + dose.astype(str))
+
+    repeat = labels.groupby(labels).cumcount()
+    labels = labels.where(repeat == 0, labels + " (" +
+                          (repeat + 1).astype(str) + ")")
+    return pd.Series(data.index, index=labels.to_numpy())
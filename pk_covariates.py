@@ -0,0 +1,85 @@
+# Patient covariate adjustment of the parsed PK parameters (no streamlit dependency).
+# The drug table holds population values for a reference adult. For one patient (body weight,
+# renal function from Cockcroft-Gault, hepatic impairment class) Vd, CL and t½ of every drug are
+# rescaled at once, as column operations on the numeric table:
+#   Vd = Vd_pop x (weight / 70)^1
+#   CL = CL_pop x (weight / 70)^0.75 x (fe x CrCl / 100 + (1 - fe) x hepatic factor)
+#   t½ = ln 2 x Vd / CL, i.e. t½_pop x Vd factor / CL factor
+# where fe is the fraction excreted unchanged in urine (urinary excretion column; 0 when missing,
+# i.e. the drug is taken to be cleared non-renally). AUC follows CL. Reported concentrations
+# (Cmax, Cmin) are left as they are: they double as target levels.
+
+import numpy as np
+
+from pk_core import find_column
+
+REFERENCE_WEIGHT = 70.0  # kg
+REFERENCE_CRCL = 100.0  # mL/min
+ALLOMETRIC_V_EXPONENT = 1.0
+ALLOMETRIC_CL_EXPONENT = 0.75
+
+# Fraction of the normal non-renal (hepatic) clearance left per impairment class
+HEPATIC_CLASSES = {
+    "Normal": 1.0,
+    "Child-Pugh A (mild)": 0.75,
+    "Child-Pugh B (moderate)": 0.5,
+    "Child-Pugh C (severe)": 0.25,
+}
+SEXES = ["Male", "Female"]
+
+DEFAULT_COVARIATES = {"weight": 70.0, "age": 50, "sex": "Male", "scr": 1.0, "hepatic": "Normal"}
+
+
+def cockcroft_gault(age, weight, scr, female):
+    # CrCl (mL/min) = (140 - age) x weight (kg) / (72 x SCr (mg/dL)), x 0.85 for women
+    age, weight, scr = (np.asarray(v, dtype="float64") for v in (age, weight, scr))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crcl = (140 - age) * weight / (72 * scr)
+    return np.where(female, 0.85 * crcl, crcl)
+
+
+def patient_crcl(covariates):
+    return float(cockcroft_gault(covariates["age"], covariates["weight"], covariates["scr"],
+                                 covariates["sex"] == "Female"))
+
+
+def renal_fraction(data, numeric):
+    # fe per row from the urinary excretion column (a fraction, see pk_units), 0 where missing
+    col = find_column(data.columns, "urinary", None)
+    if col is None or (col, "value") not in numeric.columns:
+        return np.zeros(len(numeric))
+    fe = numeric[(col, "value")].to_numpy(dtype="float64")
+    return np.nan_to_num(np.clip(fe, 0.0, 1.0))
+
+
+def covariate_factors(fe, covariates):
+    # (Vd factor, CL factor per drug) for drugs with renal fractions fe
+    size = covariates["weight"] / REFERENCE_WEIGHT
+    organ = fe * patient_crcl(covariates) / REFERENCE_CRCL + \
+        (1 - fe) * HEPATIC_CLASSES[covariates["hepatic"]]
+    return size ** ALLOMETRIC_V_EXPONENT, size ** ALLOMETRIC_CL_EXPONENT * organ
+
+
+def adjust_numeric_table(data, numeric, covariates):
+    # Copy of the numeric table (see pk_core.build_numeric_table) with Vd, CL, t½ and AUC scaled
+    # for the patient; value, SD and range are all scaled. Per-kg columns (L/kg, mL/min/kg) are
+    # scaled by the factor per kg of body weight.
+    v_factor, cl_factor = covariate_factors(renal_fraction(data, numeric), covariates)
+    per_kg = covariates["weight"] / REFERENCE_WEIGHT
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factors = {
+            find_column(data.columns, "volume", None): np.full(len(numeric), v_factor),
+            find_column(data.columns, "clearance", None): cl_factor,
+            find_column(data.columns, "half", None): v_factor / cl_factor,
+            find_column(data.columns, "auc", None): 1 / cl_factor,
+        }
+
+    adjusted = numeric.copy()
+    for col, factor in factors.items():
+        if col is None or (col, "value") not in numeric.columns:
+            continue
+        factor = np.where((numeric[(col, "unit")].astype(str).str.endswith("/kg")).to_numpy(),
+                          factor / per_kg, factor)
+        for field in ["value", "sd", "low", "high"]:
+            adjusted[(col, field)] = numeric[(col, field)].to_numpy(dtype="float64") * factor
+    return adjusted
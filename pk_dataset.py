@@ -0,0 +1,122 @@
+# Versioned drug dataset with a background workbook watcher (no streamlit dependency).
+# A dataset version bundles everything the views read: the drug table, its parsed numeric table,
+# the search index and the drug labels. When the workbook changes, the watcher thread builds the
+# next version in the background, reusing the unchanged rows of the current one, and publishes it
+# with a single assignment. Readers therefore always see one complete version, and no user request
+# ever waits for (or triggers) a reload.
+#
+# Each catalog source (a workbook sheet, or the merged view of all of them; see pk_core) gets its
+# own watcher, started the first time the source is opened.
+
+import threading
+import time
+
+import pandas as pd
+
+from pk_core import (build_drug_labels, build_numeric_table, catalog_signature, class_partition,
+                     mock_drug_table, read_source_table, update_numeric_table)
+from pk_search import build_search_index
+
+WATCH_INTERVAL = 5.0  # Seconds between checks of the workbook's size / mtime
+
+
+def dataset_version(data, signature=None, previous=None, message=None):
+    # Derived tables for one version; with a previous version only changed rows are re-parsed.
+    # timings holds the build time of each table in ms (shown in the app's developer panel).
+    timings = {}
+    started = time.perf_counter()
+    if previous is not None and not previous["data"].empty and not data.empty:
+        numeric, parsed_rows = update_numeric_table(
+            previous["data"], previous["numeric"], data)
+        timings["numeric"], started = elapsed_ms(started)
+        search_index = build_search_index(data, previous["search_index"])
+    else:
+        numeric, parsed_rows = build_numeric_table(data), len(data)
+        timings["numeric"], started = elapsed_ms(started)
+        search_index = build_search_index(data)
+    timings["search_index"], started = elapsed_ms(started)
+    labels = build_drug_labels(data)
+    timings["labels"], started = elapsed_ms(started)
+    class_groups = class_partition(data)
+    timings["class_groups"], started = elapsed_ms(started)
+
+    return {
+        "signature": signature,
+        "data": data,
+        "numeric": numeric,
+        "search_index": search_index,
+        "labels": labels,
+        "class_groups": class_groups,  # {class: row positions}
+        "parsed_rows": parsed_rows,
+        "loaded_at": time.time(),
+        "timings": timings,
+        "message": message,  # (level, text) to show with this version, e.g. ("warning", "...")
+    }
+
+
+def elapsed_ms(started):
+    # (ms since started, now) for timing consecutive build steps
+    now = time.perf_counter()
+    return (now - started) * 1000, now
+
+
+def load_dataset_version(source, signature, previous=None):
+    # Raises if the workbook cannot be read or has no 'Name' column
+    started = time.perf_counter()
+    data = read_source_table(source, signature, shared=True)
+    read_ms, _ = elapsed_ms(started)
+    if 'Name' not in data.columns:
+        raise ValueError("Your Excel file must have a column labeled 'Name'.")
+    version = dataset_version(data, signature, previous)
+    version["timings"] = dict(read=read_ms, **version["timings"])
+    return version
+
+
+def initial_dataset(source):
+    signature = catalog_signature(source)
+    if signature is None:
+        # FALLBACK: Use Mock Data if file not found
+        return dataset_version(mock_drug_table(), message=(
+            "warning", f"⚠️ '{source['id']}' not found. Displaying mock data."))
+    try:
+        return load_dataset_version(source, signature)
+    except Exception as e:
+        return dataset_version(pd.DataFrame(), signature, message=("error", f"Error reading Excel file: {e}"))
+
+
+def watch_workbook(state, interval):
+    # Poll the source's workbook(s); reload once a changed file has stayed the same for one
+    # interval, so a save in progress is not picked up half-written
+    pending = None
+    while not state["stop"].wait(interval):
+        signature = catalog_signature(state["source"])
+        current = state["current"]
+        if signature in (None, current["signature"], state.get("failed_signature")):
+            pending = None
+            continue
+        if signature != pending:
+            pending = signature
+            continue
+
+        try:
+            new_version = load_dataset_version(
+                state["source"], signature, previous=current)
+        except Exception as e:
+            # Keep serving the current version; try again after the next change
+            state["current"] = dict(current, message=(
+                "warning", f"Could not reload '{state['source']['id']}' ({e}). Showing the previously loaded data."))
+            state["failed_signature"] = signature
+            pending = None
+            continue
+        state["current"] = new_version
+        pending = None
+
+
+def start_watcher(source, interval=WATCH_INTERVAL):
+    # Loads the first version synchronously, then watches the workbook in a daemon thread.
+    # state["current"] is the version to read; state["stop"].set() ends the watcher.
+    state = {"source": source, "current": initial_dataset(source), "stop": threading.Event()}
+    state["thread"] = threading.Thread(target=watch_workbook, args=(state, interval),
+                                       name=f"watch:{source['id']}", daemon=True)
+    state["thread"].start()
+    return state
@@ -0,0 +1,275 @@
+# Parameter estimation from measured concentrations (no streamlit dependency).
+# The IV bolus models are sums of exponentials, C(t) = sum_m A_m e^(-r_m t), fitted to each
+# patient's samples by Levenberg-Marquardt least squares on log concentrations (proportional
+# error). All patients are fitted together: samples are padded to one (patients x samples)
+# array with a mask, so every iteration is a handful of batched NumPy operations however many
+# patients there are. Parameters are fitted as logs (always positive) with analytic Jacobians,
+# starting from log-linear regression guesses.
+
+import numpy as np
+import pandas as pd
+
+from pk_calc import KE_FACTOR
+
+MAX_ITERATIONS = 200
+TOLERANCE = 1e-10  # Relative change of the sum of squares at which a fit has converged
+
+# Two-sided 95% Student t quantiles by degrees of freedom; 1.96 beyond the table
+T_975 = [np.nan, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+         2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+         2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+# Models that can be fitted: registry name (pk_models.PK_MODELS) -> number of exponential terms
+FIT_MODELS = {
+    "One-Compartment IV Bolus": 1,
+    "Two-Compartment IV Bolus": 2,
+}
+
+# Sample table columns (matched case-insensitively); patient and dose are optional
+SAMPLE_COLUMNS = ["time", "conc"]
+
+
+# --- SAMPLE TABLES ---
+
+def sample_arrays(table, dose=None):
+    # Long table (one row per sample) -> (patient ids, time (P, S), conc (P, S), mask (P, S),
+    # dose (P,)); dose fills in where the table has no dose for a patient. Patients are padded
+    # to the longest sample list; samples without a positive concentration (below the limit of
+    # quantification) are masked out.
+    lookup = {str(c).strip().lower(): c for c in table.columns}
+    missing = [c for c in SAMPLE_COLUMNS if c not in lookup]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    samples = pd.DataFrame({
+        "patient": table[lookup["patient"]].astype(str) if "patient" in lookup else "1",
+        "time": pd.to_numeric(table[lookup["time"]], errors="coerce"),
+        "conc": pd.to_numeric(table[lookup["conc"]], errors="coerce"),
+        "dose": pd.to_numeric(table[lookup["dose"]], errors="coerce") if "dose" in lookup else np.nan,
+    })
+    if dose is not None:
+        samples["dose"] = samples["dose"].fillna(dose)
+    samples = samples[samples["time"].notna() & (samples["conc"] > 0)]
+    samples = samples.sort_values(["patient", "time"], kind="stable")
+
+    patients, rows = np.unique(samples["patient"].to_numpy(), return_inverse=True)
+    slots = samples.groupby("patient", sort=True).cumcount().to_numpy()
+    shape = (len(patients), slots.max() + 1 if len(slots) else 0)
+    time, conc = np.zeros(shape), np.ones(shape)
+    mask = np.zeros(shape, dtype=bool)
+    time[rows, slots] = samples["time"].to_numpy()
+    conc[rows, slots] = samples["conc"].to_numpy()
+    mask[rows, slots] = True
+    doses = samples.groupby("patient", sort=True)["dose"].first().to_numpy(dtype="float64") \
+        if len(samples) else np.zeros(0)
+    return patients, time, conc, mask, doses
+
+
+def parse_sample_text(text):
+    # Pasted "time, concentration" lines (comma, semicolon, tab or space separated) -> table
+    rows = []
+    for line in text.strip().splitlines():
+        fields = [f for f in line.replace(";", " ").replace(",", " ").split() if f]
+        if not fields:
+            continue
+        if len(fields) != 2:
+            raise ValueError(f"Expected 'time, concentration' but got: {line.strip()}")
+        rows.append([float(f) for f in fields])
+    return pd.DataFrame(rows, columns=SAMPLE_COLUMNS)
+
+
+# --- LEAST SQUARES ---
+
+def log_linear_fit(time, log_conc, mask):
+    # Weighted straight line through (t, ln C) per patient -> (intercept, slope)
+    w = mask.astype("float64")
+    n = w.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_mean = (w * time).sum(axis=1) / n
+        y_mean = (w * log_conc).sum(axis=1) / n
+        dt = (time - t_mean[:, None]) * w
+        slope = (dt * (log_conc - y_mean[:, None])).sum(axis=1) / (dt * dt).sum(axis=1)
+    slope = np.where(np.isfinite(slope), slope, 0.0)
+    return y_mean - slope * t_mean, slope
+
+
+def initial_guess(terms, time, log_conc, mask):
+    # Log-parameters [ln A_1, ln r_1, ...] from log-linear regression. Two terms: the terminal
+    # line through the later half of the samples, then a line through what is left of the
+    # early samples once the terminal phase is subtracted ("curve stripping").
+    min_rate = 1e-4
+    if terms == 1:
+        intercept, slope = log_linear_fit(time, log_conc, mask)
+        return np.column_stack([intercept, np.log(np.maximum(-slope, min_rate))])
+
+    order = np.cumsum(mask, axis=1)
+    late = mask & (order > mask.sum(axis=1, keepdims=True) // 2)
+    intercept_b, slope_b = log_linear_fit(time, log_conc, late)
+    beta = np.maximum(-slope_b, min_rate)
+
+    residual = np.exp(log_conc) - np.exp(intercept_b[:, None] - beta[:, None] * time)
+    early = mask & ~late & (residual > 0)
+    intercept_a, slope_a = log_linear_fit(
+        time, np.log(np.where(early, residual, 1.0)), early)
+    # Fall back to a fast phase 5x the terminal one where stripping leaves too little
+    usable = (early.sum(axis=1) >= 2) & (-slope_a > beta)
+    alpha = np.where(usable, -slope_a, 5 * beta)
+    intercept_a = np.where(usable, intercept_a, intercept_b)
+    return np.column_stack([intercept_a, np.log(alpha), intercept_b, np.log(beta)])
+
+
+def exponential_sum(theta, time):
+    # Curve and Jacobian of sum_m e^(theta_2m - e^(theta_2m+1) t) w.r.t. theta; shapes
+    # (P, S) and (P, S, 2M)
+    amplitude = np.exp(theta[:, 0::2])[:, None, :]
+    rate = np.exp(theta[:, 1::2])[:, None, :]
+    terms = amplitude * np.exp(-rate * time[:, :, None])
+    jacobian = np.empty(time.shape + (theta.shape[1],))
+    jacobian[:, :, 0::2] = terms
+    jacobian[:, :, 1::2] = -terms * rate * time[:, :, None]
+    return terms.sum(axis=2), jacobian
+
+
+def log_residuals(theta, time, log_conc, mask):
+    # r = ln C_obs - ln C_fit (masked samples contribute 0) and dr/dtheta
+    fitted, jacobian = exponential_sum(theta, time)
+    fitted = np.maximum(fitted, 1e-300)
+    residual = np.where(mask, log_conc - np.log(fitted), 0.0)
+    jacobian = -jacobian / fitted[:, :, None] * mask[:, :, None]
+    return residual, jacobian
+
+
+def levenberg_marquardt(theta, time, log_conc, mask):
+    # Batched damped Gauss-Newton: every patient keeps its own damping factor and stops
+    # updating once its sum of squares no longer changes. Returns (theta, sse, converged).
+    n = theta.shape[1]
+    damping = np.full(len(theta), 1e-3)
+    residual, jacobian = log_residuals(theta, time, log_conc, mask)
+    sse = (residual ** 2).sum(axis=1)
+    converged = np.zeros(len(theta), dtype=bool)
+
+    for _ in range(MAX_ITERATIONS):
+        active = ~converged
+        if not active.any():
+            break
+        jtj = np.einsum("psi,psj->pij", jacobian, jacobian)
+        jtr = np.einsum("psi,ps->pi", jacobian, residual)
+        scaled = jtj + damping[:, None, None] * (
+            np.eye(n) * np.diagonal(jtj, axis1=1, axis2=2)[:, None, :] + 1e-12 * np.eye(n))
+        step = np.linalg.solve(scaled, -jtr[:, :, None])[:, :, 0]
+
+        candidate = np.where(active[:, None], theta + step, theta)
+        new_residual, new_jacobian = log_residuals(
+            candidate, time, log_conc, mask)
+        new_sse = (new_residual ** 2).sum(axis=1)
+        better = active & np.isfinite(new_sse) & (new_sse <= sse)
+
+        converged |= better & (sse - new_sse <= TOLERANCE * np.maximum(sse, 1e-300))
+        converged |= active & (damping > 1e12)
+        theta = np.where(better[:, None], candidate, theta)
+        residual = np.where(better[:, None], new_residual, residual)
+        jacobian = np.where(better[:, None, None], new_jacobian, jacobian)
+        sse = np.where(better, new_sse, sse)
+        damping = np.where(better, damping / 10, damping * 10)
+    return theta, sse, converged
+
+
+def derived_estimates(theta, covariance, dose, t_quantile):
+    # Point estimates and 95% intervals of the reported parameters. Each is a function of the
+    # log-parameters, so its log has variance g' Cov g (delta method) and the interval is
+    # exp(ln x +/- t * se), which always stays positive. A phase whose rate collapsed to 0
+    # gives NaN / inf estimates rather than warnings.
+    amplitude, rate = np.exp(theta[:, 0::2]), np.exp(theta[:, 1::2])
+    terminal = rate.argmin(axis=1)  # Slowest phase (k, or beta for two compartments)
+    rows = np.arange(len(theta))
+    n = theta.shape[1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c0 = amplitude.sum(axis=1)
+        auc = (amplitude / rate).sum(axis=1)
+        grad_k = np.zeros((len(theta), n))
+        grad_k[rows, 2 * terminal + 1] = 1.0
+        grad_c0 = np.zeros((len(theta), n))
+        grad_c0[:, 0::2] = amplitude / c0[:, None]
+        grad_auc = np.zeros((len(theta), n))
+        grad_auc[:, 0::2] = (amplitude / rate) / auc[:, None]
+        grad_auc[:, 1::2] = -(amplitude / rate) / auc[:, None]
+
+        estimates = {
+            # name: (value, gradient of its log w.r.t. theta)
+            "C0 (mg/L)": (c0, grad_c0),
+            "k (1/h)": (rate[rows, terminal], grad_k),
+            "t½ (h)": (KE_FACTOR / rate[rows, terminal], -grad_k),
+            "Vd (L)": (dose / c0, -grad_c0),
+            "CL (L/h)": (dose / auc, -grad_auc),
+            "AUC (mg·h/L)": (auc, grad_auc),
+        }
+        result = {}
+        for name, (value, grad) in estimates.items():
+            se = np.sqrt(np.einsum("pi,pij,pj->p", grad, covariance, grad))
+            result[name] = value
+            result[f"{name} 95% low"] = value * np.exp(-t_quantile * se)
+            result[f"{name} 95% high"] = value * np.exp(t_quantile * se)
+    return result
+
+
+def fit_samples(model, time, conc, mask, dose):
+    # Fit every patient (row) of the padded sample arrays at once. Returns a DataFrame with
+    # one row per patient: estimates with 95% confidence intervals, the fitted model
+    # parameters (for pk_models.model_concentration) and fit diagnostics.
+    terms = FIT_MODELS[model]
+    n = 2 * terms
+    log_conc = np.log(conc)
+    theta = initial_guess(terms, time, log_conc, mask)
+    theta, sse, converged = levenberg_marquardt(theta, time, log_conc, mask)
+
+    # Keep the phases in a fixed order (fast first) so columns mean the same for every patient
+    if terms == 2:
+        swap = theta[:, 1] < theta[:, 3]
+        theta = np.where(swap[:, None], theta[:, [2, 3, 0, 1]], theta)
+
+    samples = mask.sum(axis=1)
+    dof = samples - n
+    _, jacobian = log_residuals(theta, time, log_conc, mask)
+    jtj = np.einsum("psi,psj->pij", jacobian, jacobian)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = np.where(dof > 0, sse / dof, np.nan)
+    covariance = np.linalg.pinv(jtj) * variance[:, None, None]
+    t_quantile = np.array([T_975[d] if 0 < d < len(T_975) else (1.96 if d > 0 else np.nan)
+                           for d in dof])
+
+    result = derived_estimates(theta, covariance, np.asarray(dose, dtype="float64"), t_quantile)
+    amplitude, rate = np.exp(theta[:, 0::2]), np.exp(theta[:, 1::2])
+    result["model_c0"] = amplitude.sum(axis=1)
+    result["model_k"] = rate[:, -1]
+    if terms == 2:
+        result["model_alpha"] = rate[:, 0]
+        result["model_frac_alpha"] = amplitude[:, 0] / amplitude.sum(axis=1)
+    result["Samples"] = samples
+    with np.errstate(invalid="ignore"):
+        result["RMSE (log)"] = np.sqrt(sse / samples)
+    result["Converged"] = converged & (samples >= n)
+    fits = pd.DataFrame(result)
+    # Fewer samples than parameters do not determine the curve: no estimates rather than invented ones
+    underdetermined = samples < n
+    fits.loc[underdetermined, fits.columns.difference(["Samples", "Converged"])] = np.nan
+    return fits
+
+
+def fit_sample_table(model, table, dose=None):
+    # Long sample table (columns time, conc and optionally patient, dose) -> one fit per patient
+    patients, time, conc, mask, doses = sample_arrays(table, dose)
+    if len(patients) == 0:
+        raise ValueError("No samples with a time and a positive concentration.")
+    fits = fit_samples(model, time, conc, mask, doses)
+    fits.insert(0, "Patient", patients)
+    fits.insert(1, "Dose (mg)", doses)
+    return fits
+
+
+def fitted_model_params(fit):
+    # One fit_samples row -> parameter dict for pk_models (per the fitted model)
+    params = {"c0": fit["model_c0"], "k": fit["model_k"]}
+    if "model_alpha" in fit and pd.notna(fit["model_alpha"]):
+        params.update(alpha=fit["model_alpha"], frac_alpha=fit["model_frac_alpha"])
+    return params
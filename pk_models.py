@@ -0,0 +1,467 @@
+# Pharmacokinetic models and curve engine, shared by the Streamlit app and the command line tool.
+# Every function works on NumPy arrays so one call evaluates many drugs / subjects at once.
+
+import re
+
+import numpy as np
+import pandas as pd
+
+import pk_calc
+
+# --- PK MODEL REGISTRY ---
+# Every model is a sum of exponentials, C(t) = sum_m coef_m * e^(-rate_m * (t - tlag)) for t >= tlag.
+# A model only has to say how its parameters map to (coefs, rates); evaluation, batching over many
+# parameter sets and multiple-dose superposition are shared. "c0" is always the concentration scale
+# of one dose (Dose / V for IV, F * Dose / V for oral).
+
+PK_MODELS = {}
+DEFAULT_KA = 1.0  # 1/h, used when ka cannot be derived from Tmax
+MAX_CHUNK_CELLS = 1_000_000  # Upper bound on (parameter sets x time points) evaluated at once
+
+
+def register_model(name, params, terms):
+    # terms(p) receives each parameter as an (N, 1) array and returns (coefs, rates) shaped (N, M)
+    PK_MODELS[name] = {"params": params, "terms": terms}
+
+
+def absorption_terms(coefs, rates, ka):
+    # First-order absorption (rate ka) into an IV response sum_m coef_m e^(-rate_m t)
+    # gives sum_m coef_m ka / (ka - rate_m) (e^(-rate_m t) - e^(-ka t)).
+    ka = np.where(np.isclose(ka, rates).any(axis=1, keepdims=True),
+                  ka * (1 + 1e-6), ka)  # ka == k limit
+    scaled = coefs * ka / (ka - rates)
+    return np.hstack([scaled, -scaled.sum(axis=1, keepdims=True)]), np.hstack([rates, ka])
+
+
+def two_compartment_terms(p):
+    # Bi-exponential disposition: distribution phase (alpha) and terminal phase (k)
+    coefs = np.hstack([p["c0"] * p["frac_alpha"],
+                      p["c0"] * (1 - p["frac_alpha"])])
+    return coefs, np.hstack([p["alpha"], p["k"]])
+
+
+register_model("One-Compartment IV Bolus", ["c0", "k"],
+               lambda p: (p["c0"], p["k"]))
+register_model("One-Compartment Oral (Bateman)", ["c0", "k", "ka", "tlag"],
+               lambda p: absorption_terms(p["c0"], p["k"], p["ka"]))
+register_model("Two-Compartment IV Bolus", ["c0", "k", "alpha", "frac_alpha"],
+               two_compartment_terms)
+register_model("Two-Compartment Oral", ["c0", "k", "alpha", "frac_alpha", "ka", "tlag"],
+               lambda p: absorption_terms(*two_compartment_terms(p), p["ka"]))
+
+
+def model_terms(model, params):
+    # Broadcast a (possibly batched) parameter dict to (N, 1) arrays and expand the model
+    names = PK_MODELS[model]["params"]
+    arrays = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(params[name], dtype="float64")) for name in names])
+    p = {name: arr.reshape(-1, 1) for name, arr in zip(names, arrays)}
+    coefs, rates = PK_MODELS[model]["terms"](p)
+    coefs, rates = np.broadcast_arrays(coefs, rates)
+    lag = p["tlag"][:, 0] if "tlag" in p else np.zeros(len(coefs))
+    return coefs, rates, lag
+
+
+def model_concentration(model, params, time_points):
+    # Concentrations for N parameter sets x T time points in one call. time_points is either
+    # one shared grid (T,) or a grid per parameter set (N, T).
+    coefs, rates, lag = model_terms(model, params)
+    time_points = np.asarray(time_points, dtype="float64")
+    if time_points.ndim == 1:
+        time_points = time_points[None, :]
+    since = time_points - lag[:, None]
+    elapsed = np.maximum(since, 0.0)
+    conc = np.zeros(elapsed.shape)
+    for m in range(coefs.shape[1]):
+        conc += coefs[:, m:m + 1] * np.exp(-rates[:, m:m + 1] * elapsed)
+    return np.where(since >= 0, np.maximum(conc, 0.0), 0.0)
+
+
+def absorption_rate_from_tmax(k, tmax):
+    # Solve Tmax = ln(ka/k) / (ka - k) for ka > k. With u = ln(ka/k) this is
+    # k * Tmax = u / (e^u - 1), which is monotonic, so bisect on u. NaN when Tmax >= 1/k.
+    target = np.asarray(k, dtype="float64") * np.asarray(tmax, dtype="float64")
+    solvable = (target > 0) & (target < 1)
+    lo = np.zeros_like(target)
+    hi = np.full_like(target, 30.0)
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        too_slow = mid / np.expm1(np.maximum(mid, 1e-12)) > target
+        lo = np.where(too_slow, mid, lo)
+        hi = np.where(too_slow, hi, mid)
+    return np.where(solvable, np.asarray(k) * np.exp((lo + hi) / 2), np.nan)
+
+
+def model_peaks(model, params, horizon):
+    # Peak concentration of each parameter set (lag ignored). The slope of a sum of exponentials
+    # is itself closed form, so bisect on its sign within [0, horizon] instead of scanning a grid.
+    coefs, rates, _ = model_terms(model, params)
+    lo = np.zeros(len(coefs))
+    hi = np.broadcast_to(np.asarray(horizon, dtype="float64"), lo.shape)
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        rising = -(coefs * rates * np.exp(-rates * mid[:, None])).sum(axis=1) > 0
+        lo = np.where(rising, mid, lo)
+        hi = np.where(rising, hi, mid)
+    return (coefs * np.exp(-rates * ((lo + hi) / 2)[:, None])).sum(axis=1)
+
+
+def drug_model_params(model, cmax, k, tmax=np.nan, ka=None, tlag=0.0, alpha_ratio=10.0, frac_alpha=0.5,
+                      is_peak=True):
+    # Model parameters for one or many drugs. Where is_peak is set the curve is scaled to peak at
+    # the given Cmax; elsewhere the value is used as C0 directly (e.g. C0 = AUC * k).
+    cmax = np.atleast_1d(np.asarray(cmax, dtype="float64"))
+    k = np.atleast_1d(np.asarray(k, dtype="float64"))
+    params = {"c0": cmax, "k": k, "tlag": tlag,
+              "alpha": k * alpha_ratio, "frac_alpha": frac_alpha}
+
+    if "ka" not in PK_MODELS[model]["params"]:
+        return params
+
+    if ka:
+        params["ka"] = np.full_like(k, ka)
+    else:
+        derived = absorption_rate_from_tmax(k, tmax)
+        params["ka"] = np.where(np.isfinite(derived), derived, DEFAULT_KA)
+
+    # Peak of the unit-scale curve lies well within a few absorption/elimination time constants
+    with np.errstate(divide="ignore", invalid="ignore"):
+        horizon = 10.0 / np.minimum(k, params["ka"])
+    peaks = model_peaks(model, dict(params, c0=1.0, tlag=0.0),
+                        np.where(np.isfinite(horizon), horizon, 72.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        params["c0"] = np.where(is_peak, np.where(
+            peaks > 0, cmax / peaks, np.nan), cmax)
+    return params
+
+
+def lognormal_samples(rng, mean, sd, n):
+    # Log-normal draws with the given arithmetic mean and SD (constant when no SD is available)
+    if mean is None:
+        return None
+    if not sd or sd <= 0 or mean <= 0:
+        return np.full(n, float(mean))
+    sigma2 = np.log1p((sd / mean) ** 2)
+    return rng.lognormal(np.log(mean) - sigma2 / 2, np.sqrt(sigma2), n)
+
+
+def population_percentiles(model, params, time_points, percentiles):
+    # Percentiles across all parameter sets at every time point. Time points are processed
+    # in blocks so at most MAX_CHUNK_CELLS concentrations are held at once.
+    n_sets = len(np.atleast_1d(params["c0"]))
+    block = max(1, MAX_CHUNK_CELLS // n_sets)
+    return np.hstack([
+        np.percentile(model_concentration(
+            model, params, time_points[i:i + block]), percentiles, axis=0)
+        for i in range(0, len(time_points), block)
+    ])
+
+
+def simulate_population(model, cmax, cmax_sd, t_half, t_half_sd, auc, auc_sd, tmax, options,
+                        n_subjects, seed, horizon, n_points=200):
+    # Monte Carlo virtual population for one drug: 5th / 50th / 95th percentile curves.
+    # auc is None unless C0 should be derived from AUC (C0 = AUC * k per subject).
+    rng = np.random.default_rng(seed)
+    t_half_s = lognormal_samples(rng, t_half, t_half_sd, n_subjects)
+    k_s = pk_calc.k_from_half_life(t_half_s)
+    if auc is not None:
+        c0_s = lognormal_samples(rng, auc, auc_sd, n_subjects) * k_s
+    else:
+        c0_s = lognormal_samples(rng, cmax, cmax_sd, n_subjects)
+
+    params = drug_model_params(model, c0_s, k_s, tmax=tmax, ka=options["ka"], tlag=options["tlag"],
+                               alpha_ratio=options["alpha_ratio"], frac_alpha=options["frac_alpha"],
+                               is_peak=auc is None)
+    # At most n_points time points, placed where the typical (median parameter) curve bends
+    typical = {name: np.median(value) for name, value in params.items()}
+    time_points, _ = adaptive_time_points(
+        model, typical, horizon, max_points=n_points)
+    p5, p50, p95 = population_percentiles(
+        model, params, time_points, [5, 50, 95])
+    return pd.DataFrame({"Time (hours)": time_points, "P5": p5, "Median": p50, "P95": p95})
+
+
+def time_to_concentration(model, params, target, horizon):
+    # Time after the peak at which a single curve falls to the target (None if it never does)
+    grid = np.linspace(0, horizon, 20001)
+    conc = model_concentration(model, params, grid)[0]
+    peak = int(conc.argmax())
+    below = np.nonzero(conc[peak:] <= target)[0]
+    if len(below) == 0:
+        return None
+    i = peak + below[0]
+    if i == peak:
+        return float(grid[i])
+    # Linear interpolation between the bracketing grid points
+    c_hi, c_lo = conc[i - 1], conc[i]
+    return float(grid[i - 1] + (c_hi - target) / (c_hi - c_lo) * (grid[i] - grid[i - 1]))
+
+
+def steady_state_metrics(model, params, tau, points=1001):
+    # Peak, trough and average at steady state. Each exponential term accumulates to
+    # coef / (1 - e^(-rate tau)), so one interval of the steady-state profile is closed form.
+    coefs, rates, lag = model_terms(model, params)
+    since = np.linspace(0, tau, points)
+    ss = (coefs[0, :, None] / -np.expm1(-rates[0, :, None] * tau)
+          * np.exp(-rates[0, :, None] * since[None, :])).sum(axis=0)
+    cavg = (coefs[0] / rates[0]).sum() / tau  # AUC(0-inf) of one dose / tau
+    return float(ss.max()), float(ss.min()), float(cavg)
+
+
+# --- CURVE SAMPLING ---
+# Curves are sampled where they bend (and at dose / lag events) instead of on a fixed grid, then
+# thinned with LTTB before they are sent to the browser, so long or multi-drug charts stay small.
+
+ADAPTIVE_TOL = 1e-3  # Max straight-line error between samples, relative to the largest concentration
+ADAPTIVE_MAX_POINTS = 2000  # Upper bound on samples per curve
+CHART_MAX_POINTS = 1000  # Points per series sent to Altair / Vega
+
+
+def refine_grid(grid, evaluate, tol=ADAPTIVE_TOL, max_points=ADAPTIVE_MAX_POINTS):
+    # Insert midpoints where straight lines between samples miss the curve (high curvature),
+    # worst intervals first, until every interval is within tol or max_points is reached.
+    # evaluate(t) returns one curve (T,) or several (N, T); the worst curve decides.
+    grid = np.unique(np.asarray(grid, dtype="float64"))
+    values = np.atleast_2d(evaluate(grid))
+    scale = np.abs(values).max() if values.size else 0.0
+    while len(grid) < max_points and scale > 0:
+        mids = (grid[:-1] + grid[1:]) / 2
+        mid_values = np.atleast_2d(evaluate(mids))
+        error = np.abs(
+            mid_values - (values[:, :-1] + values[:, 1:]) / 2).max(axis=0)
+        worst = np.argsort(-error, kind="stable")[:max_points - len(grid)]
+        worst = np.sort(worst[error[worst] > tol * scale])
+        if len(worst) == 0:
+            break
+        grid = np.insert(grid, worst + 1, mids[worst])
+        values = np.insert(values, worst + 1, mid_values[:, worst], axis=1)
+        scale = max(scale, np.abs(mid_values).max())
+    return grid, values
+
+
+def adaptive_time_points(model, params, end_time, events=(), max_points=ADAPTIVE_MAX_POINTS):
+    # Shared time grid on [0, end_time] for one or many parameter sets; lag times and the
+    # given events (e.g. dose times) are always sampled. Returns (time_points, (N, T) matrix).
+    lags = model_terms(model, params)[2]
+    marks = np.concatenate([np.linspace(0, end_time, 33), lags, np.asarray(events, dtype="float64")])
+    marks = marks[(marks >= 0) & (marks <= end_time)]
+    return refine_grid(marks, lambda t: model_concentration(model, params, t), max_points=max_points)
+
+
+def lttb_indices(x, y, n_out=CHART_MAX_POINTS):
+    # Largest-Triangle-Three-Buckets: positions of n_out points (first and last included) that
+    # keep the visual shape of the series - peaks and troughs survive, flat stretches are thinned.
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)  # n_out - 2 interior buckets
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x, next_y = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        # Keep the point forming the largest triangle with the last kept point and the next bucket's mean
+        area = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) -
+                      (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+# --- PK CURVE ENGINE ---
+
+def dosing_schedule(dose, interval, n_doses, missed=(), delays=None):
+    # Dose times/amounts for a regular regimen, optionally with missed (1-based dose
+    # numbers, amount set to 0) and late doses ({dose number: hours late}).
+    times = np.arange(n_doses, dtype="float64") * interval
+    amounts = np.full(n_doses, float(dose))
+
+    missed = [m for m in missed if 1 <= m <= n_doses]
+    amounts[np.asarray(missed, dtype=int) - 1] = 0.0
+    for dose_no, hours_late in (delays or {}).items():
+        if 1 <= dose_no <= n_doses:
+            times[dose_no - 1] += hours_late
+
+    order = np.argsort(times, kind="stable")
+    return times[order], amounts[order]
+
+
+def amounts_after_doses(dose_times, dose_amounts, k):
+    # Amount in the body just after each dose: A_j = sum_{i<=j} D_i * e^(-k (t_j - t_i))
+    dose_times = np.asarray(dose_times, dtype="float64")
+    dose_amounts = np.asarray(dose_amounts, dtype="float64")
+    n = len(dose_times)
+    if n == 0:
+        return dose_amounts
+
+    gaps = np.diff(dose_times)
+    if n == 1 or (np.allclose(gaps, gaps[0]) and np.allclose(dose_amounts, dose_amounts[0])):
+        # Regular regimen: geometric series D * (1 - r^(j+1)) / (1 - r) with r = e^(-k tau)
+        tau = gaps[0] if n > 1 else 0.0
+        j = np.arange(1, n + 1)
+        if tau * k == 0:
+            return dose_amounts[0] * j
+        return dose_amounts[0] * np.expm1(-k * tau * j) / np.expm1(-k * tau)
+
+    # Irregular regimen: same sum evaluated in log space so e^(k t) never overflows
+    with np.errstate(divide="ignore"):
+        log_terms = np.log(dose_amounts) + k * dose_times
+    return np.exp(np.logaddexp.accumulate(log_terms) - k * dose_times)
+
+
+def superposition_profile(dose_times, dose_amounts, model, params, points_per_interval=None, end_time=None):
+    # Concentration-time profile of one parameter set ("c0" per unit dose) for any dosing schedule.
+    # Each exponential term of the model superposes on its own via amounts_after_doses. Every
+    # interval between (lag-shifted) doses is sampled from just after its dose to just before
+    # the next one, so IV jumps at dose times are drawn exactly. All intervals share one set of
+    # sampling fractions: points_per_interval evenly spaced ones, or (None / 0) fractions refined
+    # where any interval's curve bends.
+    coefs, rates, lag = model_terms(model, params)
+    starts = np.asarray(dose_times, dtype="float64") + lag[0]
+    if end_time is None:
+        end_time = starts[-1] + (np.diff(starts).mean()
+                                 if len(starts) > 1 else 24.0)
+
+    seg_end = np.append(starts[1:], max(end_time, starts[-1]))
+    seg_len = seg_end - starts
+    amounts = [amounts_after_doses(starts, dose_amounts, rates[0, m])
+               for m in range(coefs.shape[1])]
+
+    def interval_concs(frac):
+        elapsed = seg_len[:, None] * frac[None, :]
+        concs = np.zeros(elapsed.shape)
+        for m in range(coefs.shape[1]):
+            concs += coefs[0, m] * amounts[m][:, None] * \
+                np.exp(-rates[0, m] * elapsed)
+        return concs
+
+    if points_per_interval:
+        frac = np.linspace(0.0, 1.0, points_per_interval)
+        concs = interval_concs(frac)
+    else:
+        # Keep (intervals x fractions) within MAX_CHUNK_CELLS
+        max_points = int(np.clip(MAX_CHUNK_CELLS // len(starts), 9, 200))
+        frac, concs = refine_grid(np.linspace(0.0, 1.0, 9), interval_concs,
+                                  max_points=max_points)
+
+    times = (starts[:, None] + seg_len[:, None] * frac[None, :]).ravel()
+    concs = np.maximum(concs.ravel(), 0.0)
+    if starts[0] > 0:
+        # Nothing absorbed yet during the lag time
+        times = np.concatenate([[0.0, starts[0]], times])
+        concs = np.concatenate([[0.0, 0.0], concs])
+    return times, concs
+
+
+def parse_dose_numbers(text):
+    # "3, 7" -> [3, 7]
+    return [int(tok) for tok in re.split(r"[,\s]+", text.strip()) if tok]
+
+
+def parse_dose_delays(text):
+    # "4:2.5, 9:1" -> {4: 2.5, 9: 1.0}
+    delays = {}
+    for tok in re.split(r"[,\s]+", text.strip()):
+        if tok:
+            dose_no, hours = tok.split(":")
+            delays[int(dose_no)] = float(hours)
+    return delays
+
+
+def curves_to_long(labels, time_points, matrix, max_points=None):
+    # Long format (one row per drug/time point) for layered Altair charts; with max_points each
+    # curve is thinned to at most that many points (LTTB)
+    if max_points is None:
+        n_drugs, n_times = matrix.shape
+        return pd.DataFrame({
+            "Drug": np.repeat(np.asarray(labels, dtype=object), n_times),
+            "Time (hours)": np.tile(time_points, n_drugs),
+            "Concentration (ng/mL)": matrix.ravel(),
+        })
+
+    keep = [lttb_indices(time_points, row, max_points) for row in matrix]
+    return pd.DataFrame({
+        "Drug": np.repeat(np.asarray(labels, dtype=object), [len(k) for k in keep]),
+        "Time (hours)": np.concatenate([time_points[k] for k in keep]),
+        "Concentration (ng/mL)": np.concatenate([row[k] for row, k in zip(matrix, keep)]),
+    })
+
+
+# --- MULTI-DRUG REGIMENS ---
+# Several drugs taken together, each on its own regular regimen, evaluated on one shared time grid.
+# With regular dosing every exponential term superposes to a geometric series, so the concentration
+# at time t only needs the number of doses given so far and the time since the last one. All drugs
+# x terms x time points are then one array expression, however many doses the timeline holds.
+
+SS_FRACTION = 0.9  # Steady state counts as reached once the trough is this fraction of Cmin,ss
+
+
+def regimen_terms(model, params, doses, intervals, starts, n_doses=np.inf):
+    # Model terms of N drugs ("c0" per mg of dose) scaled by each drug's dose, with the regimen
+    # arrays broadcast to (N, 1): (coefs, rates, first dose time incl. lag, tau, n_doses)
+    coefs, rates, lag = model_terms(model, params)
+    doses, intervals, starts, n_doses = (
+        np.broadcast_to(np.asarray(v, dtype="float64"), lag.shape)[:, None]
+        for v in (doses, intervals, starts, n_doses))
+    return coefs * doses, rates, starts + lag[:, None], intervals, n_doses
+
+
+def regimen_concentrations(model, params, doses, intervals, starts, time_points, n_doses=np.inf):
+    # (N, T) concentrations of N drugs, drug i dosed doses[i] mg every intervals[i] h from
+    # starts[i] h on (n_doses[i] times; by default dosing never stops)
+    coefs, rates, first, tau, n_doses = regimen_terms(model, params, doses, intervals, starts, n_doses)
+    since_first = np.asarray(time_points, dtype="float64")[None, :] - first
+    given = np.clip(np.floor(since_first / tau) + 1, 0, n_doses)
+    since_last = since_first - (given - 1) * tau
+
+    conc = np.zeros(since_first.shape)
+    for m in range(coefs.shape[1]):
+        rate = rates[:, m:m + 1]
+        # sum over the doses given so far of e^(-rate (since_last + j tau)), j = 0 .. given - 1
+        accumulated = np.expm1(-rate * tau * given) / np.expm1(-rate * tau)
+        conc += coefs[:, m:m + 1] * accumulated * np.exp(-rate * since_last)
+    return np.where(given > 0, np.maximum(conc, 0.0), 0.0)
+
+
+def regimen_time_grid(model, params, intervals, starts, end_time, points_per_hour, n_doses=np.inf):
+    # Evenly spaced grid on [0, end_time] plus every (lag-shifted) dose time, so IV jumps are drawn
+    _, _, first, tau, n_doses = regimen_terms(model, params, 1.0, intervals, starts, n_doses)
+    counts = np.minimum(n_doses, np.maximum(np.floor((end_time - first) / tau) + 1, 0))
+    dose_times = [f + np.arange(n) * t for f, t, n in zip(first[:, 0], tau[:, 0], counts[:, 0])]
+    grid = np.unique(np.concatenate(
+        [np.linspace(0, end_time, int(end_time * points_per_hour) + 1)] + dose_times))
+    return grid[(grid >= 0) & (grid <= end_time)]
+
+
+def regimen_steady_state(model, params, doses, intervals, starts, n_doses=np.inf,
+                         fraction=SS_FRACTION, points=1001):
+    # Per drug: Cmax,ss, Cmin,ss and Cavg,ss, the number of doses after which the trough first
+    # reaches fraction x Cmin,ss and the time of that trough (NaN if the regimen stops before).
+    # The trough after n doses, sum_m coef_m r_m (1 - r_m^n) / (1 - r_m) with r_m = e^(-rate_m tau),
+    # grows with n (each dose adds a single-dose concentration), so n is found by bisection.
+    coefs, rates, first, tau, n_doses = regimen_terms(model, params, doses, intervals, starts, n_doses)
+    since = np.linspace(0, 1, points)[None, None, :] * tau[:, :, None]
+    accumulation = -np.expm1(-rates * tau)
+    ss_profile = ((coefs / accumulation)[:, :, None] * np.exp(-rates[:, :, None] * since)).sum(axis=1)
+    trough_ss = ss_profile[:, -1]
+
+    def trough(n):
+        return (coefs * np.exp(-rates * tau) * -np.expm1(-rates * tau * n[:, None]) / accumulation).sum(axis=1)
+
+    lo, hi = np.zeros(len(coefs)), np.full(len(coefs), 2.0 ** 40)
+    for _ in range(41):
+        mid = np.floor((lo + hi) / 2)
+        reached = trough(mid) >= fraction * trough_ss
+        lo, hi = np.where(reached, lo, mid), np.where(reached, mid, hi)
+    n_ss = np.where((trough_ss > 0) & (hi <= n_doses[:, 0]), hi, np.nan)
+    return pd.DataFrame({
+        "Cmax,ss": ss_profile.max(axis=1),
+        "Cmin,ss": trough_ss,
+        "Cavg,ss": (coefs / rates).sum(axis=1) / tau[:, 0],
+        "Doses to Steady State": n_ss,
+        "Steady State at (h)": first[:, 0] + n_ss * tau[:, 0],
+    })
@@ -0,0 +1,174 @@
+# Non-compartmental analysis (NCA) of raw concentration-time profiles (no streamlit dependency).
+# A long table (one row per sample, many subjects) is analysed in one pass: every statistic is
+# computed for all profiles at once from sorted arrays and per-profile group codes, and the
+# terminal slope is chosen among all candidate point windows of all profiles with suffix sums.
+# AUC and CL then feed the same pk_calc formulas as the calculator tabs.
+
+import numpy as np
+import pandas as pd
+
+import pk_calc
+
+LAMBDA_Z_MIN_POINTS = 3  # Fewest terminal points used for the elimination slope
+ADJ_R2_TOLERANCE = 1e-4  # Windows this close to the best adjusted R² count as equal; the longest wins
+IV_ROUTES = {"iv", "i.v.", "intravenous", "iv bolus"}
+
+
+def profile_samples(table, dose=None, route="oral"):
+    # Long table with columns time, conc and optionally subject (or patient), route, dose ->
+    # cleaned samples sorted by profile and time. dose / route fill in where the table has none.
+    lookup = {str(c).strip().lower(): c for c in table.columns}
+    missing = [c for c in ["time", "conc"] if c not in lookup]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    subject = lookup.get("subject", lookup.get("patient"))
+
+    samples = pd.DataFrame({
+        "subject": table[subject].astype(str) if subject is not None else "1",
+        "route": table[lookup["route"]].astype(str).str.strip() if "route" in lookup else route,
+        "time": pd.to_numeric(table[lookup["time"]], errors="coerce"),
+        # Samples below the limit of quantification are often written as 0 or left negative
+        "conc": pd.to_numeric(table[lookup["conc"]], errors="coerce").clip(lower=0),
+        "dose": pd.to_numeric(table[lookup["dose"]], errors="coerce") if "dose" in lookup else np.nan,
+    })
+    if dose is not None:
+        samples["dose"] = samples["dose"].fillna(dose)
+    samples = samples.dropna(subset=["time", "conc"])
+    # Repeated time points (duplicate rows) are averaged so every interval has a positive width
+    samples = samples.groupby(["subject", "route", "time"], sort=True, as_index=False).agg(
+        conc=("conc", "mean"), dose=("dose", "first"))
+    return samples.reset_index(drop=True)
+
+
+def interval_auc(t1, t2, c1, c2):
+    # Linear-up / log-down trapezoids: the log rule where the concentration falls between two
+    # positive samples (exact for exponential decline), the linear rule everywhere else.
+    # ln(c1/c2) is taken as log1p((c1 - c2) / c2) so nearly equal samples keep their precision.
+    dt = t2 - t1
+    log_down = (c2 < c1) & (c2 > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_auc = dt * (c1 - c2) / np.log1p((c1 - c2) / c2)
+    return np.where(log_down, log_auc, dt * (c1 + c2) / 2)
+
+
+def terminal_slopes(group, time, conc, tmax, tlast, clast, n_groups):
+    # λz per profile: log-linear regression through the last n positive samples after Tmax,
+    # for every n >= LAMBDA_Z_MIN_POINTS at once, keeping the best adjusted R² (ties -> most
+    # points). Times / logs are taken relative to the last sample so the sums stay small.
+    eligible = (conc > 0) & (time > tmax[group]) & (time <= tlast[group])
+    rank = pd.Series(group[eligible]).groupby(group[eligible]).cumcount(ascending=False).to_numpy()
+    count = np.bincount(group[eligible], minlength=n_groups)
+    width = max(count.max() if n_groups else 0, 1)
+
+    x, y = np.zeros((n_groups, width)), np.zeros((n_groups, width))
+    x[group[eligible], rank] = time[eligible] - tlast[group[eligible]]
+    y[group[eligible], rank] = np.log(conc[eligible] / clast[group[eligible]])
+
+    n = np.arange(1, width + 1, dtype="float64")
+    sx, sy = x.cumsum(axis=1), y.cumsum(axis=1)
+    sxx = (x * x).cumsum(axis=1) - sx * sx / n
+    sxy = (x * y).cumsum(axis=1) - sx * sy / n
+    syy = (y * y).cumsum(axis=1) - sy * sy / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = sxy / sxx
+        r2 = np.where(syy > 0, sxy * sxy / (sxx * syy), 1.0)
+        adj_r2 = 1 - (1 - r2) * (n - 1) / (n - 2)
+
+    valid = (n >= LAMBDA_Z_MIN_POINTS) & (n <= count[:, None]) & (sxx > 0) & (slope < 0)
+    best = np.where(valid, adj_r2, -np.inf).max(axis=1)
+    chosen = valid & (adj_r2 >= best[:, None] - ADJ_R2_TOLERANCE)
+    last = width - 1 - chosen[:, ::-1].argmax(axis=1)
+    found = chosen.any(axis=1)
+    rows = np.arange(n_groups)
+    return (np.where(found, -slope[rows, last], np.nan),
+            np.where(found, last + 1, 0),
+            np.where(found, adj_r2[rows, last], np.nan))
+
+
+def nca(table, dose=None, route="oral"):
+    # One row per profile (subject x route): Cmax, Tmax, Tlast, Clast, AUC0-t, λz, t½,
+    # AUC0-inf, % extrapolated, and with a dose CL (CL/F for extravascular routes) and Vz.
+    # Units follow the input: time in h and conc in mg/L give AUC in mg·h/L and, with dose in
+    # mg, CL in L/h and Vz in L.
+    samples = profile_samples(table, dose, route)
+    if samples.empty:
+        raise ValueError("No samples with both a time and a concentration")
+    profiles = samples.groupby(["subject", "route"], sort=True)
+    group = profiles.ngroup().to_numpy()
+    n_groups = profiles.ngroups
+    time = samples["time"].to_numpy(dtype="float64")
+    conc = samples["conc"].to_numpy(dtype="float64")
+
+    keys = profiles.size().reset_index()[["subject", "route"]]
+    is_iv = keys["route"].str.lower().isin(IV_ROUTES).to_numpy()
+
+    cmax_row = samples.groupby(group)["conc"].idxmax().to_numpy()
+    cmax, tmax = conc[cmax_row], time[cmax_row]
+    positive = conc > 0
+    last_row = pd.Series(np.flatnonzero(positive)).groupby(group[positive]).max()
+    tlast, clast = np.full(n_groups, np.nan), np.full(n_groups, np.nan)
+    tlast[last_row.index] = time[last_row.to_numpy()]
+    clast[last_row.index] = conc[last_row.to_numpy()]
+
+    # AUC0-t: intervals between consecutive samples of a profile, up to Tlast
+    same = group[1:] == group[:-1]
+    inside = same & (time[1:] <= tlast[group[1:]])
+    segments = np.where(inside, interval_auc(time[:-1], time[1:], conc[:-1], conc[1:]), 0.0)
+    auc_last = np.bincount(group[1:], weights=segments, minlength=n_groups).astype("float64")
+
+    # Area before the first sample: C(0) = 0 after an extravascular dose; after an IV bolus C0 is
+    # back-extrapolated log-linearly from the first two samples (their first value if not falling)
+    first = np.r_[True, ~same]
+    first_row = np.flatnonzero(first)
+    second_row = np.minimum(first_row + 1, len(conc) - 1)
+    t1, c1 = time[first_row], conc[first_row]
+    t2, c2 = time[second_row], conc[second_row]
+    falling = (second_row != first_row) & np.r_[same, False][first_row] & (c2 < c1) & (c2 > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c0 = np.where(falling, c1 * (c1 / c2) ** (t1 / (t2 - t1)), c1)
+    c0 = np.where(is_iv, c0, 0.0)
+    auc_last += np.where(t1 > 0, interval_auc(np.zeros(n_groups), t1, c0, c1), 0.0)
+
+    # A single sample gives neither an area nor a slope
+    single = np.bincount(group, minlength=n_groups) < 2
+    auc_last[single] = np.nan
+
+    lambda_z, points, adj_r2 = terminal_slopes(group, time, conc, tmax, tlast, clast, n_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        auc_extra = clast / lambda_z
+    auc_inf = auc_last + auc_extra
+
+    dose = samples.groupby(group)["dose"].first().to_numpy(dtype="float64")
+    result = keys.rename(columns={"subject": "Subject", "route": "Route"})
+    result["Dose (mg)"] = dose
+    result["Cmax"] = cmax
+    result["Tmax (h)"] = tmax
+    result["Tlast (h)"] = tlast
+    result["Clast"] = clast
+    result["AUC0-t"] = auc_last
+    result["λz (1/h)"] = lambda_z
+    result["t½ (h)"] = pk_calc.half_life_from_k(lambda_z)
+    result["λz Points"] = points
+    result["Adj. R²"] = adj_r2
+    result["AUC0-inf"] = auc_inf
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["AUC % Extrapolated"] = 100 * auc_extra / auc_inf
+        result["Vz (L)"] = dose / (lambda_z * auc_inf)
+    result["CL (L/h)"] = pk_calc.clearance(dose, 1.0, auc_inf)  # CL/F after an extravascular dose
+    return result
+
+
+def nca_bioavailability(results):
+    # Absolute F per subject with both an IV and an extravascular profile, from AUC0-inf and the
+    # doses (pk_calc.bioavailability); empty when the study has no such crossover
+    is_iv = results["Route"].str.lower().isin(IV_ROUTES)
+    iv = results[is_iv].drop_duplicates("Subject").set_index("Subject")
+    oral = results[~is_iv].drop_duplicates("Subject").set_index("Subject")
+    subjects = oral.index.intersection(iv.index)
+    iv, oral = iv.loc[subjects], oral.loc[subjects]
+    return pd.DataFrame({
+        "Subject": subjects,
+        "Route": oral["Route"].to_numpy(),
+        "F": pk_calc.bioavailability(oral["AUC0-inf"], oral["Dose (mg)"],
+                                     iv["AUC0-inf"], iv["Dose (mg)"]),
+    })
@@ -0,0 +1,167 @@
+# Opt-in timing instrumentation (no streamlit dependency).
+# A "run" is one script or fragment rerun of the app. While a run is active on the current thread,
+# span(name) records how long each stage took (nested spans keep their depth), count() tallies
+# cache calls / misses, and end_run() writes the whole run as one JSON line to the "pk.profile"
+# logger. Without an active run span() and count() cost next to nothing, so the stages can stay
+# instrumented permanently.
+#
+#   PK_PROFILE=1 streamlit run pk_app.py        (or open the app with ?profile=1)
+#   PK_PROFILE_LOG=profile.jsonl                 also append the JSON lines to this file
+#
+# A single run can additionally be captured with cProfile (or pyinstrument, when installed).
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import pyinstrument
+except ImportError:  # Optional; cProfile is always available
+    pyinstrument = None
+
+PROFILE_ENV = "PK_PROFILE"
+PROFILE_LOG_ENV = "PK_PROFILE_LOG"
+PROFILE_TOP_FUNCTIONS = 30  # Lines of the cProfile report kept with a captured run
+CAPTURE_MODES = ["cProfile"] + (["pyinstrument"] if pyinstrument is not None else [])
+
+LOGGER = logging.getLogger("pk.profile")
+
+_local = threading.local()
+_counters = {}  # {cache name: {"calls": n, "misses": n}}, for the whole server process
+_lock = threading.Lock()
+
+
+def enabled_by_env():
+    return os.environ.get(PROFILE_ENV, "").strip().lower() not in ("", "0", "false", "no")
+
+
+def _log_handler():
+    # File handler for PK_PROFILE_LOG, added once per process
+    path = os.environ.get(PROFILE_LOG_ENV)
+    if path and not any(getattr(h, "pk_profile_log", None) == path for h in LOGGER.handlers):
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler.pk_profile_log = path
+        LOGGER.addHandler(handler)
+        LOGGER.setLevel(logging.INFO)
+
+
+# --- RUNS ---
+
+def active_run():
+    return getattr(_local, "run", None)
+
+
+def begin_run(label, session=None, capture=None):
+    # Start recording on this thread; capture = "cProfile" / "pyinstrument" profiles the whole run
+    run = {"label": label, "session": session, "started": time.time(), "t0": time.perf_counter(),
+           "depth": 0, "spans": [], "caches": {}, "profiler": None}
+    if capture == "cProfile":
+        run["profiler"] = cProfile.Profile()
+        run["profiler"].enable()
+    elif capture == "pyinstrument" and pyinstrument is not None:
+        run["profiler"] = pyinstrument.Profiler(async_mode="disabled")
+        run["profiler"].start()
+    _local.run = run
+    return run
+
+
+def end_run():
+    # Finish the active run: JSON log line, and the record (None when no run was active)
+    run = active_run()
+    if run is None:
+        return None
+    _local.run = None
+    record = {
+        "label": run["label"],
+        "session": run["session"],
+        "started": run["started"],
+        "total_ms": (time.perf_counter() - run["t0"]) * 1000,
+        "spans": run["spans"],
+        "caches": run["caches"],
+    }
+    _log_handler()
+    LOGGER.info(json.dumps(record, default=str))
+
+    profiler = run["profiler"]
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        record["profile"] = report.getvalue()
+    elif profiler is not None:
+        profiler.stop()
+        record["profile"] = profiler.output_text(unicode=True)
+    return record
+
+
+@contextmanager
+def span(name):
+    # Time the enclosed block as one stage of the active run
+    run = active_run()
+    if run is None:
+        yield
+        return
+    start = time.perf_counter()
+    depth = run["depth"]
+    run["depth"] += 1
+    try:
+        yield
+    finally:
+        run["depth"] = depth
+        run["spans"].append({"name": name, "depth": depth, "start_ms": (start - run["t0"]) * 1000,
+                             "ms": (time.perf_counter() - start) * 1000})
+
+
+def timed(name):
+    # Decorator form of span
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def profiled_run(label, session=None, capture=None):
+    # A run of its own unless one is already active (e.g. a fragment rerun vs a full rerun);
+    # yields the record holder, whose "record" is filled in when this block started the run
+    holder = {"record": None}
+    if active_run() is not None:
+        yield holder
+        return
+    begin_run(label, session, capture)
+    try:
+        yield holder
+    finally:
+        holder["record"] = end_run()
+
+
+# --- CACHE COUNTERS ---
+
+def count(cache, event):
+    # event is "calls" or "misses"; hits are calls - misses
+    with _lock:
+        counters = _counters.setdefault(cache, {"calls": 0, "misses": 0})
+        counters[event] += 1
+    run = active_run()
+    if run is not None:
+        counters = run["caches"].setdefault(cache, {"calls": 0, "misses": 0})
+        counters[event] += 1
+
+
+def cache_stats():
+    # Process-wide counters per cache, with hit rates
+    with _lock:
+        return {name: dict(c, hits=c["calls"] - c["misses"],
+                           hit_rate=(c["calls"] - c["misses"]) / c["calls"] if c["calls"] else None)
+                for name, c in _counters.items()}
@@ -0,0 +1,149 @@
+# Ranked, typo-tolerant search over the drug table (no streamlit dependency).
+
+import bisect
+import re
+
+import numpy as np
+import pandas as pd
+
+# --- SEARCH INDEX ---
+# Built once per dataset version and shared by all views: token postings per row with field
+# weights, a sorted vocabulary for prefix lookups and a trigram index for substring / typo matches.
+
+SEARCH_FIELD_WEIGHTS = {"Name": 3.0, "Class": 2.0}  # Other text columns weigh 1.0
+SEARCH_SYNONYMS = {
+    # Brand names -> generic names
+    "altace": "ramipril", "aldactone": "spironolactone", "brilinta": "ticagrelor",
+    "cardizem": "diltiazem", "cardura": "doxazosin", "catapres": "clonidine",
+    "cordarone": "amiodarone", "coreg": "carvedilol", "coumadin": "warfarin",
+    "cozaar": "losartan", "crestor": "rosuvastatin", "diovan": "valsartan",
+    "eliquis": "apixaban", "farxiga": "dapagliflozin", "inspra": "eplerenone",
+    "jardiance": "empagliflozin", "lanoxin": "digoxin", "lasix": "furosemide",
+    "lipitor": "atorvastatin", "lopressor": "metoprolol", "lovenox": "enoxaparin",
+    "micardis": "telmisartan", "multaq": "dronedarone", "norvasc": "amlodipine",
+    "plavix": "clopidogrel", "pradaxa": "dabigatran", "prinivil": "lisinopril",
+    "repatha": "evolocumab", "tenormin": "atenolol", "toprol": "metoprolol",
+    "vasotec": "enalapril", "verquvo": "vericiguat", "xarelto": "rivaroxaban",
+    "zestril": "lisinopril", "zetia": "ezetimibe", "zocor": "simvastatin",
+    # Common class abbreviations
+    "acei": "ace inhibitor", "bb": "beta blocker", "ccb": "calcium channel blocker",
+    "doac": "anticoagulant", "noac": "anticoagulant", "sglt2": "antidiabetic",
+}
+
+
+def search_tokens(text):
+    # "Metoprolol Succinate" -> ["metoprolol", "succinate"]
+    return re.findall(r"[0-9a-zµ]+", str(text).lower())
+
+
+def trigrams(token):
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    # Levenshtein distance, stopping early once it exceeds limit
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1,
+                       prev[j - 1] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+def build_search_index(data, previous=None):
+    # previous: index of an earlier version of the table. Tokens of cell values it already saw
+    # are reused, so after an edit only new or changed values are tokenized again.
+    known_tokens = previous["value_tokens"] if previous else {}
+    value_tokens = {}
+    postings = {}  # token -> list of (row positions, field weight)
+    if not data.empty:
+        text_cols = [c for c in data.columns if c in SEARCH_FIELD_WEIGHTS or
+                     not pd.api.types.is_numeric_dtype(data[c])]
+        for col in text_cols:
+            weight = SEARCH_FIELD_WEIGHTS.get(col, 1.0)
+            # Tokenize each distinct cell value once, then map it to all rows holding it
+            codes, uniques = pd.factorize(data[col])
+            rows_by_code = pd.Series(np.arange(len(data))).groupby(codes).indices
+            for code, value in enumerate(uniques):
+                tokens = value_tokens.get(value)
+                if tokens is None:
+                    tokens = known_tokens.get(value)
+                    if tokens is None:
+                        tokens = set(search_tokens(value))
+                    value_tokens[value] = tokens
+                for token in tokens:
+                    postings.setdefault(token, []).append(
+                        (rows_by_code[code], weight))
+
+    grams = {}
+    for token in postings:
+        for gram in trigrams(token):
+            grams.setdefault(gram, set()).add(token)
+
+    return {"n_rows": len(data), "postings": postings, "vocab": sorted(postings), "trigrams": grams,
+            "value_tokens": value_tokens}
+
+
+def match_token(index, query_token):
+    # Vocabulary tokens matching one query token, with a match quality in (0, 1]
+    vocab = index["vocab"]
+    matches = {}
+    if query_token in index["postings"]:
+        matches[query_token] = 1.0
+
+    # Prefix matches: contiguous run in the sorted vocabulary
+    pos = bisect.bisect_left(vocab, query_token)
+    while pos < len(vocab) and vocab[pos].startswith(query_token):
+        matches.setdefault(vocab[pos], 0.9)
+        pos += 1
+
+    if len(query_token) < 3:
+        return matches
+
+    # Substring and typo-tolerant matches via shared trigrams
+    query_grams = trigrams(query_token)
+    shared = {}
+    for gram in query_grams:
+        for token in index["trigrams"].get(gram, ()):
+            shared[token] = shared.get(token, 0) + 1
+
+    max_dist = 1 if len(query_token) <= 6 else 2
+    for token, count in shared.items():
+        if token in matches:
+            continue
+        if query_token in token:
+            matches[token] = 0.75
+        elif len(query_token) >= 4 and count >= len(query_grams) - 3 * max_dist and \
+                abs(len(token) - len(query_token)) <= max_dist:
+            dist = edit_distance(query_token, token, max_dist)
+            if dist <= max_dist:
+                matches[token] = 0.6 - 0.1 * dist
+    return matches
+
+
+def query_search_index(index, query):
+    # Row positions matching every query term, best matches first (ties keep table order)
+    query_tokens = []
+    for token in search_tokens(query):
+        query_tokens.extend(search_tokens(SEARCH_SYNONYMS.get(token, token)))
+    if not query_tokens:
+        return np.arange(index["n_rows"])
+
+    total = np.zeros(index["n_rows"])
+    matched_all = np.ones(index["n_rows"], dtype=bool)
+    for query_token in query_tokens:
+        token_score = np.zeros(index["n_rows"])
+        for token, quality in match_token(index, query_token).items():
+            for rows, weight in index["postings"][token]:
+                token_score[rows] = np.maximum(
+                    token_score[rows], quality * weight)
+        matched_all &= token_score > 0
+        total += token_score
+
+    positions = np.nonzero(matched_all)[0]
+    return positions[np.argsort(-total[positions], kind="stable")]
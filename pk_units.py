@@ -0,0 +1,172 @@
+# Unit normalization for parsed PK columns (no streamlit dependency).
+# Every numeric PK column is converted once, at load time, to one canonical unit per quantity
+# (concentrations in ng/mL, times in h, fractions such as F in 0-1, ...), so plots and
+# calculators can combine columns without looking at units again. Conversions are resolved per
+# distinct unit string (a handful per column) and applied to the whole column as one array
+# multiplication.
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Canonical unit of each quantity; every value in the numeric table is in one of these
+CANONICAL_UNITS = {
+    "concentration": "ng/mL",
+    "exposure": "ng·h/mL",
+    "time": "h",
+    "mass": "mg",
+    "volume": "L",
+    "volume_per_kg": "L/kg",
+    "clearance": "mL/min",
+    "clearance_per_kg": "mL/min/kg",
+    "fraction": "fraction",  # 0-1; "%" cells are divided by 100
+}
+
+# unit_key(unit) -> (quantity, factor to the canonical unit)
+UNITS = {
+    # Concentration -> ng/mL
+    "pg/ml": ("concentration", 1e-3),
+    "ng/l": ("concentration", 1e-3),
+    "ng/ml": ("concentration", 1.0),
+    "µg/l": ("concentration", 1.0),
+    "µg/dl": ("concentration", 10.0),
+    "µg/ml": ("concentration", 1e3),
+    "mg/l": ("concentration", 1e3),
+    "mg/dl": ("concentration", 1e4),
+    "mg/ml": ("concentration", 1e6),
+    "g/l": ("concentration", 1e6),
+    # Exposure (AUC) -> ng·h/mL
+    "ng·h/ml": ("exposure", 1.0),
+    "ng·min/ml": ("exposure", 1 / 60),
+    "µg·h/l": ("exposure", 1.0),
+    "µg·h/ml": ("exposure", 1e3),
+    "µg·min/ml": ("exposure", 1e3 / 60),
+    "mg·h/l": ("exposure", 1e3),
+    "mg·min/l": ("exposure", 1e3 / 60),
+    # Time -> h
+    "s": ("time", 1 / 3600),
+    "min": ("time", 1 / 60),
+    "h": ("time", 1.0),
+    "d": ("time", 24.0),
+    "wk": ("time", 168.0),
+    # Mass (doses) -> mg
+    "ng": ("mass", 1e-6),
+    "µg": ("mass", 1e-3),
+    "mg": ("mass", 1.0),
+    "g": ("mass", 1e3),
+    # Volume -> L
+    "ml": ("volume", 1e-3),
+    "l": ("volume", 1.0),
+    "ml/kg": ("volume_per_kg", 1e-3),
+    "l/kg": ("volume_per_kg", 1.0),
+    # Clearance -> mL/min
+    "ml/h": ("clearance", 1 / 60),
+    "ml/min": ("clearance", 1.0),
+    "l/h": ("clearance", 1e3 / 60),
+    "l/min": ("clearance", 1e3),
+    "ml/h/kg": ("clearance_per_kg", 1 / 60),
+    "ml/min/kg": ("clearance_per_kg", 1.0),
+    "l/h/kg": ("clearance_per_kg", 1e3 / 60),
+    "l/min/kg": ("clearance_per_kg", 1e3),
+    "%": ("fraction", 0.01),
+}
+
+# Quantity of a column whose header names no unit, by header keyword (first match wins).
+# Bare numbers in such a column are taken to be in the canonical unit already.
+COLUMN_QUANTITIES = [
+    ("auc", "exposure"),
+    ("area under", "exposure"),
+    ("cmax", "concentration"),
+    ("cmin", "concentration"),
+    ("half", "time"),
+    ("tmax", "time"),
+    ("clearance", "clearance"),
+    ("volume", "volume"),
+    ("dos", "mass"),
+    ("bioavail", "fraction"),
+    ("excret", "fraction"),
+    ("urinary", "fraction"),
+]
+
+
+def unit_key(unit):
+    # Spelling-independent key: "Ng.Hr/Ml", "ng*h/mL" and "ng·hr/ml" -> "ng·h/ml"
+    key = str(unit).strip().lower().replace("μ", "µ").replace("mcg", "µg")
+    key = re.sub(r"\bug", "µg", key)
+    key = re.sub(r"[.*×]", "·", key)
+    key = re.sub(r"\b(hours?|hrs?)\b", "h", key)
+    key = re.sub(r"\b(minutes?|mins)\b", "min", key)
+    key = re.sub(r"\b(seconds?|secs?)\b", "s", key)
+    key = re.sub(r"\b(days?)\b", "d", key)
+    key = re.sub(r"\b(weeks?|wks)\b", "wk", key)
+    return key.replace(" ", "")
+
+
+def header_unit(column):
+    # Unit named in a header, e.g. "Cmax (ng/mL)", "AUC [ng.hr/mL]" or "Auc ng.hr/mL"
+    candidates = re.findall(r"[(\[]([^)\]]+)[)\]]", column)[::-1] + column.split()[-1:]
+    for text in candidates:
+        if unit_key(text) in UNITS:
+            return text
+    return None
+
+
+def column_quantity(column):
+    # (quantity, factor of bare numbers to the canonical unit) for a PK column; quantity is None
+    # when neither the header's unit nor its name tells what the column measures
+    unit = header_unit(column)
+    if unit is not None:
+        return UNITS[unit_key(unit)]
+    lower = column.lower()
+    for keyword, quantity in COLUMN_QUANTITIES:
+        if keyword in lower:
+            return quantity, 1.0
+    return None, 1.0
+
+
+def normalize_units(parsed, column):
+    # Parsed block of one column (see pk_core.parse_numeric_column) -> the same block with
+    # value/sd/low/high in canonical units, "unit" = unit code of the converted value and
+    # "source_unit" = the unit as written in the cell. Cells in an unknown unit, or in a unit
+    # of another quantity than the column's, are left as written.
+    quantity, bare_factor = column_quantity(column)
+    source = parsed["unit"].astype("category")
+
+    codes, factors = [], []
+    for unit in source.cat.categories:
+        entry = UNITS.get(unit_key(unit))
+        if entry is not None and quantity in (None, entry[0]):
+            codes.append(CANONICAL_UNITS[entry[0]])
+            factors.append(entry[1])
+        else:
+            codes.append(unit)
+            factors.append(1.0)
+    # Code -1 (cell without a unit) picks the trailing entry: the column's own unit
+    codes.append(CANONICAL_UNITS[quantity] if quantity else None)
+    factors.append(bare_factor)
+
+    positions = source.cat.codes.to_numpy()
+    factor = np.array(factors)[positions]
+    if quantity == "fraction":
+        # Bare numbers in fraction columns are written both ways ("0.9", "90"), whatever the
+        # header says; above 1 they can only be percentages
+        bare = positions == -1
+        factor[bare] = np.where(parsed["value"].to_numpy(dtype="float64")[bare] > 1, 0.01, 1.0)
+    normalized = parsed.copy()
+    normalized[["value", "sd", "low", "high"]] = parsed[[
+        "value", "sd", "low", "high"]].to_numpy() * factor[:, None]
+    unit_codes = np.array(codes, dtype=object)[positions]
+    unit_codes[normalized["value"].isna().to_numpy()] = None
+    normalized["unit"] = pd.Categorical(unit_codes)
+    normalized["source_unit"] = source
+    return normalized
+
+
+def convert(values, from_unit, to_unit):
+    # Convert between two units of the same quantity, e.g. convert(500, "ng·h/mL", "mg·h/L") -> 0.5
+    from_quantity, from_factor = UNITS[unit_key(from_unit)]
+    to_quantity, to_factor = UNITS[unit_key(to_unit)]
+    if from_quantity != to_quantity:
+        raise ValueError(f"Cannot convert {from_unit} to {to_unit}")
+    return np.asarray(values, dtype="float64") * (from_factor / to_factor)